@@ -1,6 +1,9 @@
+import sys
 import firebase_admin
 from firebase_admin import credentials, firestore
 from typing import Dict, List, Optional
+from course_import import CREATE_ONLY, UPSERT_CHANGED, import_courses, print_import_summary
+from course_ranking import insert_course_rank, rerank_courses
 
 def initialize_firebase(credentials_path: str) -> Optional[firestore.Client]:
     """
@@ -32,6 +35,19 @@ def generate_searchable_fields(course_name: str, normalized_code: str) -> List[s
     searchable_fields = set(course_name_tokens + normalized_code_tokens + numeric_tokens)
     return list(searchable_fields)
 
+def build_course_document(course_code: str, course_name: str, school: str) -> Dict:
+    """
+    Course document fields derived from the course code, name and school
+    """
+    normalized_code = normalize_code(course_code)
+    return {
+        'course_name': course_name,
+        'normalized_code': normalized_code,
+        'school': school,
+        'course_name_lowercase': course_name.lower(),
+        'searchable_fields': generate_searchable_fields(course_name, normalized_code)
+    }
+
 def add_course(db: firestore.Client, course_data: Dict) -> bool:
     """
     Add a new course to Firestore
@@ -62,19 +78,9 @@ def add_course(db: firestore.Client, course_data: Dict) -> bool:
             print(f"Course {course_code} already exists")
             return False
             
-        # Generate normalized code and searchable fields
-        normalized_code = normalize_code(course_code)
-        searchable_fields = generate_searchable_fields(course_name, normalized_code)
-        
         # Prepare course document data
-        course_document = {
-            'course_name': course_name,
-            'normalized_code': normalized_code,
-            'school': school,
-            'course_name_lowercase': course_name.lower(),
-            'searchable_fields': searchable_fields,
-            'total_papers': 0  # Initialize with 0 papers
-        }
+        course_document = build_course_document(course_code, course_name, school)
+        course_document['total_papers'] = 0  # Initialize with 0 papers
         
         # Create course document
         course_ref.set(course_document)
@@ -84,6 +90,9 @@ def add_course(db: firestore.Client, course_data: Dict) -> bool:
         for subcollection in subcollections:
             course_ref.collection(subcollection).document('placeholder').set({})
         
+        # Number the new course and shift only the courses ordered after it
+        insert_course_rank(db, course_ref, course_document['normalized_code'])
+        
         print(f"Successfully added course: {course_code} - {course_name}")
         return True
         
@@ -91,12 +100,32 @@ def add_course(db: firestore.Client, course_data: Dict) -> bool:
         print(f"Error adding course: {e}")
         return False
 
+def add_courses_from_csv(db: firestore.Client, csv_file_path: str, upsert: bool = False) -> Dict:
+    """
+    Bulk version of add_course for a CSV with source, Course Code and Course Name columns.
+    Existing courses are left alone, or with upsert only their changed fields are written.
+    item_count is then re-ranked once for the whole import, writing only shifted courses.
+    """
+    stats = import_courses(db, csv_file_path, build_course_document,
+                           mode=UPSERT_CHANGED if upsert else CREATE_ONLY,
+                           initial_fields={'total_papers': 0})
+    print_import_summary(stats)
+    if stats['created'] or stats['updated']:
+        rerank_courses(db)
+    return stats
+
 def main():
     # Initialize Firebase
     db = initialize_firebase("campus-aid-webg-firebase-adminsdk-fbsvc-d6b27736e3.json")
     if not db:
         return
     
+    # Optional: python add_courses.py courses.csv [--upsert]
+    csv_paths = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    if csv_paths:
+        add_courses_from_csv(db, csv_paths[0], upsert='--upsert' in sys.argv)
+        return
+    
     while True:
         print("\n=== Add New Course ===")
         print("(Press Enter without input to exit)")
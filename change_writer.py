@@ -0,0 +1,68 @@
+from write_engine import BulkWriteError, WriteEngine
+
+_MISSING = object()
+
+class ChangeWriter:
+    """
+    Update writer that skips documents whose computed fields already match
+    the snapshot the caller has in hand, so an unchanged document costs no write.
+    Real changes go through the shared WriteEngine.
+
+        writer = ChangeWriter(db)
+        for doc in docs:
+            writer.update(doc.reference, doc.to_dict(), {"field": compute(doc)})
+        writer.flush()
+        print(writer.summary())
+        writer.close()
+
+    unordered_fields names array fields built from sets (e.g. searchable_fields),
+    whose element order changes from run to run without the value changing.
+    Pass engine to share one WriteEngine with other writes of the same job;
+    close() then leaves it open for its owner.
+    """
+    def __init__(self, db, unordered_fields=(), engine=None):
+        self.owns_engine = engine is None
+        self.engine = engine or WriteEngine(db)
+        self.unordered_fields = set(unordered_fields)
+        self.skipped = 0
+
+    @property
+    def written(self):
+        return self.engine.written
+
+    def _same(self, field, stored, computed):
+        if field in self.unordered_fields and isinstance(stored, list) and isinstance(computed, list):
+            return len(stored) == len(computed) and set(stored) == set(computed)
+        return stored == computed
+
+    def changes(self, stored, fields):
+        """The subset of fields whose value differs from (or is missing in) the stored data"""
+        stored = stored or {}
+        return {
+            field: value for field, value in fields.items()
+            if not self._same(field, stored.get(field, _MISSING), value)
+        }
+
+    def update(self, doc_ref, stored, fields):
+        """Queue the changed fields of one document; returns them ({} when nothing changed)"""
+        changed = self.changes(stored, fields)
+        if not changed:
+            self.skipped += 1
+            return changed
+        self.engine.update(doc_ref, changed)
+        return changed
+
+    def flush(self):
+        """Wait for every queued update; raises BulkWriteError if any failed permanently"""
+        failures = self.engine.flush()
+        if failures:
+            raise BulkWriteError(failures)
+
+    def close(self):
+        """Wait for every queued update and shut the engine down; returns the failures not yet reported"""
+        if self.owns_engine:
+            return self.engine.close()
+        return self.engine.flush()
+
+    def summary(self):
+        return f"{self.written} written, {self.skipped} unchanged"
@@ -0,0 +1,110 @@
+import json
+import os
+
+from firebase_admin import firestore
+from tenacity import retry, stop_after_attempt, wait_exponential
+
+# ---- CONFIGURATION ---- #
+PAGE_SIZE = 300  # Documents fetched per query page
+
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
+def fetch_page(query):
+    """Fetches one page of a query with retry logic."""
+    return list(query.stream())
+
+class CheckpointedQuery:
+    """
+    Pages through a query in a stable order and remembers, in a local JSON state file,
+    the last document the caller has committed. After a crash or a quota error the next
+    run continues with a start_after cursor, so the completed prefix is never fetched again.
+
+        courses = CheckpointedQuery(db.collection("courses"), "job_checkpoint.json")
+        for course in courses:
+            ...write...
+            courses.commit(course)
+        courses.finish()
+
+    order_field keeps a custom order (e.g. "normalized_code"); document ID breaks ties.
+    Without it documents come in document-ID order.
+    """
+    def __init__(self, query, state_file, order_field=None, page_size=PAGE_SIZE):
+        self.state_file = state_file
+        self.order_field = order_field
+        self.page_size = page_size
+        if order_field:
+            query = query.order_by(order_field)
+        self.query = query.order_by(firestore.FieldPath.document_id())
+        self.state = self._load()
+
+    def _load(self):
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    @property
+    def resumed(self):
+        return self.state is not None
+
+    @property
+    def processed(self):
+        """Documents committed so far, including earlier runs of the same job"""
+        return self.state["processed"] if self.state else 0
+
+    @property
+    def last_id(self):
+        return self.state["last_id"] if self.state else None
+
+    def _cursor(self):
+        cursor = {"__name__": self.state["last_id"]}
+        if self.order_field:
+            cursor = {self.order_field: self.state["order_value"], **cursor}
+        return cursor
+
+    def pages(self):
+        """Yields lists of up to page_size snapshots, starting after the last committed document"""
+        cursor = self._cursor() if self.state else None
+        while True:
+            query = self.query.limit(self.page_size)
+            if cursor:
+                query = query.start_after(cursor)
+            page = fetch_page(query)
+            if not page:
+                return
+            yield page
+            if len(page) < self.page_size:
+                return
+            cursor = self._snapshot_cursor(page[-1])
+
+    def __iter__(self):
+        for page in self.pages():
+            yield from page
+
+    def _snapshot_cursor(self, snapshot):
+        cursor = {"__name__": snapshot.id}
+        if self.order_field:
+            cursor = {self.order_field: snapshot.get(self.order_field), **cursor}
+        return cursor
+
+    def commit(self, snapshot, count=1):
+        """
+        Record that everything up to and including snapshot is done.
+        count is the number of documents this commit covers (e.g. a whole page).
+        """
+        self.state = {
+            "last_id": snapshot.id,
+            "order_value": snapshot.get(self.order_field) if self.order_field else None,
+            "processed": self.processed + count
+        }
+        # Write then rename, so a crash mid-write never leaves a corrupt state file
+        tmp_file = self.state_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_file, self.state_file)
+
+    def finish(self):
+        """The job completed: forget the checkpoint so the next run starts from the beginning"""
+        self.state = None
+        if os.path.exists(self.state_file):
+            os.remove(self.state_file)
@@ -0,0 +1,74 @@
+from firebase_admin import firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
+from tenacity import retry, stop_after_attempt, wait_exponential
+
+# ---- CONFIGURATION ---- #
+PLACEHOLDER_ID = "placeholder"  # Empty doc that keeps a sub-collection alive, never a paper
+
+# Paper sub-collection -> course field holding its count
+SUB_COLLECTIONS = {
+    "mid-semester": "mid_sem_papers",
+    "end-semester": "end_sem_papers",
+    "quizzes": "quiz_papers"
+}
+
+# ---- COUNTING ---- #
+def iter_course_refs(db):
+    """
+    References of every existing course document.
+    select([]) asks for no fields, so each course costs one read and no payload,
+    and courses that only exist as a parent path are not returned.
+    """
+    for course in db.collection("courses").select([]).stream():
+        yield course.reference
+
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
+def count_papers(sub_collection_ref):
+    """
+    Server-side count of the papers in a sub-collection, placeholder excluded.
+    Billed as one read per 1000 matching index entries instead of one per paper.
+    """
+    query = sub_collection_ref.where(
+        filter=FieldFilter(firestore.FieldPath.document_id(), "!=", sub_collection_ref.document(PLACEHOLDER_ID))
+    )
+    results = query.count(alias="papers").get()
+    return int(results[0][0].value)
+
+def count_course_papers(course_ref):
+    """Returns {'mid_sem_papers': n, 'end_sem_papers': n, 'quiz_papers': n, 'total_papers': n}"""
+    counters = {
+        counter_field: count_papers(course_ref.collection(sub_collection))
+        for sub_collection, counter_field in SUB_COLLECTIONS.items()
+    }
+    counters["total_papers"] = sum(counters.values())
+    return counters
+
+# ---- COLLECTION GROUP SCAN ---- #
+COUNTER_FIELDS = list(SUB_COLLECTIONS.values()) + ["total_papers"]
+
+def read_course_counters(db):
+    """{course_id: (course_ref, {counter field: stored value})} for every existing course"""
+    courses = {}
+    for course in db.collection("courses").select(COUNTER_FIELDS).stream():
+        data = course.to_dict() or {}
+        courses[course.id] = (course.reference, {field: data.get(field) for field in COUNTER_FIELDS})
+    return courses
+
+def scan_paper_counts(db):
+    """
+    Count the papers of every course in one paged collection_group stream per
+    sub-collection name, instead of one query per (course, sub-collection).
+    Only document references are read (select([])), but each paper is still
+    billed as one read, whereas count() bills one read per 1000 papers.
+    Returns {course_id: {'mid_sem_papers': n, 'end_sem_papers': n, 'quiz_papers': n}}.
+    """
+    counts = {}
+    for sub_collection, counter_field in SUB_COLLECTIONS.items():
+        for doc in db.collection_group(sub_collection).select([]).stream():
+            course_ref = doc.reference.parent.parent
+            # Same-named collections elsewhere in the database are not papers
+            if doc.id == PLACEHOLDER_ID or course_ref is None or course_ref.parent.id != "courses":
+                continue
+            course_counts = counts.setdefault(course_ref.id, dict.fromkeys(SUB_COLLECTIONS.values(), 0))
+            course_counts[counter_field] += 1
+    return counts
@@ -0,0 +1,188 @@
+import concurrent.futures
+import sys
+
+import firebase_admin
+from firebase_admin import credentials, firestore
+
+from change_writer import ChangeWriter
+from checkpoint import CheckpointedQuery
+from course_counts import SUB_COLLECTIONS, count_papers
+from course_ranking import rerank_courses
+from firestore_emulator import emulator_client
+from write_engine import describe_failure
+
+# ---- CONFIGURATION ---- #
+PAGE_SIZE = 400     # Courses derived and written per checkpointed page
+MAX_WORKERS = 16    # Paper count queries in flight at once
+CHECKPOINT_FILE = "course_pipeline_checkpoint.json"
+
+# ---- DERIVERS ---- #
+class CourseDeriver:
+    """
+    One denormalization of the course documents.
+      source_fields     course fields derive() reads
+      fields            course fields derive() writes (read too, to skip unchanged values)
+      unordered_fields  written arrays whose element order is not significant
+    prepare_page() runs once per page before derive() is called for its courses,
+    for derivers that need batched work. Courses come in document-ID order, so a
+    deriver must only depend on the course itself (item_count, which depends on
+    every course, is kept by course_ranking instead).
+    """
+    source_fields = ()
+    fields = ()
+    unordered_fields = ()
+
+    def prepare_page(self, courses):
+        pass
+
+    def derive(self, course, data):
+        raise NotImplementedError
+
+    def finish(self):
+        pass
+
+class LowercaseNameDeriver(CourseDeriver):
+    """course_name_lowercase (was scriptthree.py)"""
+    source_fields = ("course_name",)
+    fields = ("course_name_lowercase",)
+
+    def derive(self, course, data):
+        return {"course_name_lowercase": data.get("course_name", "").lower()}
+
+def generate_searchable_fields(course_data):
+    """Lowercase name words, the normalized code and its digits"""
+    course_name = course_data.get("course_name", "")
+    normalized_code = course_data.get("normalized_code", "")
+
+    course_name_tokens = course_name.lower().split()
+    normalized_code_tokens = [normalized_code.lower()]
+    numeric_tokens = ["".join(filter(str.isdigit, normalized_code))]
+
+    return list(set(course_name_tokens + normalized_code_tokens + numeric_tokens))
+
+class SearchableFieldsDeriver(CourseDeriver):
+    """searchable_fields (was scriptfour.py)"""
+    source_fields = ("course_name", "normalized_code")
+    fields = ("searchable_fields",)
+    # Built from a set, so its order alone is not a change
+    unordered_fields = ("searchable_fields",)
+
+    def derive(self, course, data):
+        return {"searchable_fields": generate_searchable_fields(data)}
+
+class PaperCountDeriver(CourseDeriver):
+    """
+    total_papers and the per-type counts (was script16.py). Every (course, sub-collection)
+    count() of a page runs concurrently; a course whose counts could not all be read
+    keeps its stored counters, since a partial count would overwrite a correct total.
+    """
+    fields = tuple(SUB_COLLECTIONS.values()) + ("total_papers",)
+
+    def __init__(self, max_workers=MAX_WORKERS):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        self.failed = set()
+
+    def prepare_page(self, courses):
+        self.counters = {course.id: {} for course in courses}
+        futures = {
+            self.executor.submit(count_papers, course.reference.collection(sub_collection)): (course.id, counter_field)
+            for course in courses
+            for sub_collection, counter_field in SUB_COLLECTIONS.items()
+        }
+        for future in concurrent.futures.as_completed(futures):
+            course_id, counter_field = futures[future]
+            try:
+                self.counters[course_id][counter_field] = future.result()
+            except Exception as e:
+                print(f"Error counting {counter_field} for {course_id}: {e}")
+                self.failed.add(course_id)
+
+    def derive(self, course, data):
+        if course.id in self.failed:
+            return {}
+        counters = dict(self.counters[course.id])
+        counters["total_papers"] = sum(counters.values())
+        return counters
+
+    def finish(self):
+        self.executor.shutdown()
+        if self.failed:
+            print(f"Paper counts left unchanged for {len(self.failed)} courses: {sorted(self.failed)}")
+
+def default_derivers(counts=True):
+    derivers = [LowercaseNameDeriver(), SearchableFieldsDeriver()]
+    if counts:
+        derivers.append(PaperCountDeriver())
+    return derivers
+
+# ---- PIPELINE ---- #
+def run_pipeline(db, derivers, rank=True, page_size=PAGE_SIZE, checkpoint_file=CHECKPOINT_FILE):
+    """
+    Streams every course once in document-ID order, runs every deriver on each course
+    and merges their outputs into a single update per course, written only when some
+    derived field differs from the stored value. One scan and at most one write per
+    course, instead of one scan and one write per course for each separate script.
+    Progress is checkpointed after every page, so a stopped run resumes with the next page.
+
+    With rank, item_count (was script9.py) is then brought up to date by
+    course_ranking.rerank_courses, which reads only normalized_code and item_count
+    and writes only the courses whose position shifted.
+    """
+    read_fields = set()
+    unordered_fields = set()
+    for deriver in derivers:
+        read_fields.update(deriver.source_fields)
+        read_fields.update(deriver.fields)
+        unordered_fields.update(deriver.unordered_fields)
+
+    courses_query = db.collection("courses").select(sorted(read_fields))
+    courses = CheckpointedQuery(courses_query, checkpoint_file, page_size=page_size)
+    if courses.resumed:
+        print(f"Resuming after {courses.last_id} ({courses.processed} courses already processed)")
+    writer = ChangeWriter(db, unordered_fields=unordered_fields)
+
+    try:
+        for page in courses.pages():
+            for deriver in derivers:
+                deriver.prepare_page(page)
+            for course in page:
+                data = course.to_dict() or {}
+                update_data = {}
+                for deriver in derivers:
+                    update_data.update(deriver.derive(course, data))
+                changed = writer.update(course.reference, data, update_data)
+                if changed:
+                    print(f"Updated {course.id}: {', '.join(sorted(changed))}")
+            writer.flush()
+            courses.commit(page[-1], count=len(page))
+            print(f"Processed {courses.processed} courses so far ({writer.summary()})")
+    except Exception as e:
+        print(f"Failed to update courses: {e}")
+        print(f"Stopped after {courses.processed} courses; run again to resume")
+        return
+    finally:
+        for deriver in derivers:
+            deriver.finish()
+        for failure in writer.close():
+            print(f"Failed to update {describe_failure(failure)}")
+
+    print(f"Processed all {courses.processed} courses: {writer.summary()}")
+    courses.finish()
+
+    if rank:
+        rerank_courses(db)
+
+# ---- RUN ---- #
+def initialize_firebase(credentials_path):
+    """Firestore client for the emulator when FIRESTORE_EMULATOR_HOST is set, else the project"""
+    emulator_db = emulator_client()
+    if emulator_db is not None:
+        return emulator_db
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app(credentials.Certificate(credentials_path))
+    return firestore.client()
+
+if __name__ == "__main__":
+    db = initialize_firebase("campusaid-afe4b-firebase-adminsdk-i2di4-4484b29e45.json")
+    # Optional: python course_pipeline.py --skip-counts  (no paper count() queries)
+    run_pipeline(db, default_derivers(counts="--skip-counts" not in sys.argv))
@@ -0,0 +1,93 @@
+from google.cloud.firestore_v1.base_query import FieldFilter
+from tenacity import retry, stop_after_attempt, wait_exponential
+
+from change_writer import ChangeWriter
+
+# item_count is a course's 1-based position when courses are ordered by
+# normalized_code, with the document ID breaking ties: the order of
+# CheckpointedQuery(order_field="normalized_code") used by script9 --resumable.
+# Like Firestore's order_by, courses without a
+# normalized_code field get no item_count, and null codes sort first.
+RANK_FIELDS = ["normalized_code", "item_count"]
+
+def rank_key(course_id, normalized_code):
+    return (normalized_code is not None, normalized_code or "", course_id)
+
+# ---- FULL RE-RANK ---- #
+def read_course_ranks(db):
+    """[(course_ref, normalized_code, stored item_count)] for every ranked course, in one streaming read"""
+    courses = []
+    for course in db.collection("courses").select(RANK_FIELDS).stream():
+        data = course.to_dict() or {}
+        if "normalized_code" not in data:
+            continue  # Left out of order_by("normalized_code"), so not ranked
+        courses.append((course.reference, data.get("normalized_code"), data.get("item_count")))
+    return courses
+
+def rank_changes(courses):
+    """
+    Ranks courses in memory and diffs against the stored item_count.
+    Returns [(course_ref, stored item_count, new item_count)] for the courses that moved.
+    """
+    ordered = sorted(courses, key=lambda course: rank_key(course[0].id, course[1]))
+    return [
+        (course_ref, stored, position)
+        for position, (course_ref, _, stored) in enumerate(ordered, start=1)
+        if stored != position
+    ]
+
+def rerank_courses(db):
+    """
+    Recomputes every item_count and writes only the courses whose number shifted,
+    e.g. just the courses after a newly added one. Returns the number written.
+    """
+    changes = rank_changes(read_course_ranks(db))
+    if not changes:
+        print("item_count already up to date")
+        return 0
+
+    writer = ChangeWriter(db)
+    for course_ref, stored, position in changes:
+        writer.update(course_ref, {"item_count": stored}, {"item_count": position})
+    writer.flush()
+
+    positions = [position for _, _, position in changes]
+    print(f"Renumbered {len(changes)} courses between item_count {min(positions)} and {max(positions)}")
+    return writer.written
+
+# ---- INSERT FAST PATH ---- #
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
+def count_courses(db):
+    """Server-side count of the ranked courses (order_by leaves out those without normalized_code)"""
+    results = db.collection("courses").order_by("normalized_code").count(alias="courses").get()
+    return int(results[0][0].value)
+
+def insert_course_rank(db, course_ref, normalized_code):
+    """
+    Gives a course that was just created its item_count and shifts only the courses
+    ordered after it, reading that suffix and one count() instead of every course.
+    Assumes the other item_counts were consistent; concurrent inserts can race,
+    and rerank_courses repairs any drift. Returns the new course's item_count.
+    """
+    new_key = rank_key(course_ref.id, normalized_code)
+    suffix_query = db.collection("courses").where(
+        filter=FieldFilter("normalized_code", ">=", normalized_code)
+    ).select(RANK_FIELDS)
+
+    suffix = []
+    for course in suffix_query.stream():
+        data = course.to_dict() or {}
+        if rank_key(course.id, data.get("normalized_code")) > new_key:
+            suffix.append((course.reference, data.get("normalized_code"), data.get("item_count")))
+    suffix.sort(key=lambda course: rank_key(course[0].id, course[1]))
+
+    total = count_courses(db)
+    position = total - len(suffix)
+
+    writer = ChangeWriter(db)
+    writer.update(course_ref, {}, {"item_count": position})
+    for shifted_position, (suffix_ref, _, stored) in enumerate(suffix, start=position + 1):
+        writer.update(suffix_ref, {"item_count": stored}, {"item_count": shifted_position})
+    writer.flush()
+    print(f"{course_ref.id} is item {position}; {writer.written - 1} later courses shifted")
+    return position
@@ -0,0 +1,263 @@
+import bisect
+import gzip
+import heapq
+import json
+import re
+import sys
+from array import array
+from collections import Counter
+
+import firebase_admin
+from firebase_admin import credentials, firestore
+
+from firestore_emulator import emulator_client
+
+# ---- CONFIGURATION ---- #
+INDEX_FILE = "course_search_index.json.gz"  # Single artifact written by build and read by query
+INDEX_VERSION = 1
+SHORT_PREFIX_LEN = 2     # Edge n-grams up to this length get precomputed postings
+MIN_FUZZY_LEN = 4        # Shorter terms are too ambiguous for typo matching
+LONG_TERM_LEN = 10       # Terms at least this long tolerate 2 typos instead of 1
+DEFAULT_LIMIT = 10
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_ALPHA_NUM_RE = re.compile(r"[a-z]+|[0-9]+")
+
+# ---- TOKENIZATION ---- #
+def tokenize(text):
+    """Lowercase alphanumeric words; punctuation and spaces separate tokens"""
+    return _WORD_RE.findall((text or "").lower())
+
+def course_tokens(course_id, course_name, normalized_code, searchable_fields=()):
+    """
+    Every token a course can be found by: name words, the course ID words, the full
+    normalized code and its letter/digit runs ("swe2020" -> "swe", "2020"), plus whatever
+    is already stored in searchable_fields. Prefixes are not stored: they are served
+    by range lookups in the sorted token array.
+    """
+    tokens = set(tokenize(course_name))
+    tokens.update(tokenize(course_id))
+    for code in tokenize(normalized_code):
+        tokens.add(code)
+        tokens.update(_ALPHA_NUM_RE.findall(code))
+    for field in searchable_fields or ():
+        tokens.update(tokenize(field))
+    return tokens
+
+def trigrams(token):
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+def edit_distance(a, b, max_distance):
+    """Levenshtein distance, or max_distance + 1 once it is certain to exceed max_distance"""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, start=1):
+        current = [i]
+        for j, char_b in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+# ---- INDEX ---- #
+class CourseSearchIndex:
+    """
+    Compact in-process inverted index over courses.
+      tokens      sorted vocabulary; the tokens starting with a prefix are one bisect range
+      postings    per token, the sorted numbers of the docs containing it
+      doc_tokens  per doc, its token numbers (forward index for filtering extra terms)
+    Doc numbers follow sorted course ID order, so every posting list is also in ID order.
+    Short edge n-grams and token trigrams (for typos) are derived on load.
+    """
+    def __init__(self, doc_ids, names, tokens, postings, doc_tokens):
+        self.doc_ids = doc_ids
+        self.names = names
+        self.tokens = tokens
+        self.postings = [array("I", p) for p in postings]
+        self.doc_tokens = [array("I", t) for t in doc_tokens]
+        self._build_derived()
+
+    @classmethod
+    def build(cls, rows):
+        """rows: iterable of (course_id, course_name, normalized_code, searchable_fields)"""
+        docs = sorted(rows, key=lambda row: row[0])
+        per_doc = [course_tokens(*row) for row in docs]
+        tokens = sorted(set().union(*per_doc)) if per_doc else []
+        token_numbers = {token: number for number, token in enumerate(tokens)}
+        postings = [[] for _ in tokens]
+        doc_tokens = []
+        for doc_number, doc_token_set in enumerate(per_doc):
+            numbers = sorted(token_numbers[token] for token in doc_token_set)
+            doc_tokens.append(numbers)
+            for number in numbers:
+                postings[number].append(doc_number)
+        return cls([row[0] for row in docs], [row[1] or "" for row in docs], tokens, postings, doc_tokens)
+
+    def _build_derived(self):
+        self.prefix_docs = {}
+        for length in range(1, SHORT_PREFIX_LEN + 1):
+            groups = {}
+            for number, token in enumerate(self.tokens):
+                if len(token) >= length:
+                    groups.setdefault(token[:length], []).append(number)
+            for prefix, numbers in groups.items():
+                self.prefix_docs[prefix] = array("I", sorted(set().union(*(self.postings[n] for n in numbers))))
+        self.trigram_tokens = {}
+        for number, token in enumerate(self.tokens):
+            for gram in trigrams(token):
+                self.trigram_tokens.setdefault(gram, array("I")).append(number)
+
+    # ---- SERIALIZATION ---- #
+    def to_dict(self):
+        return {
+            "version": INDEX_VERSION,
+            "doc_ids": self.doc_ids,
+            "names": self.names,
+            "tokens": self.tokens,
+            "postings": [p.tolist() for p in self.postings],
+            "doc_tokens": [t.tolist() for t in self.doc_tokens]
+        }
+
+    def save(self, path=INDEX_FILE):
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path=INDEX_FILE):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != INDEX_VERSION:
+            raise ValueError(f"{path} was built by an incompatible version; rebuild it")
+        return cls(data["doc_ids"], data["names"], data["tokens"], data["postings"], data["doc_tokens"])
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    # ---- QUERYING ---- #
+    def _token_range(self, prefix):
+        lo = bisect.bisect_left(self.tokens, prefix)
+        hi = bisect.bisect_left(self.tokens, prefix + "\uffff", lo)
+        return lo, hi
+
+    def _fuzzy_tokens(self, term):
+        """Token numbers whose prefix is within 1 edit (2 for long terms) of term"""
+        max_edits = 1 if len(term) < LONG_TERM_LEN else 2
+        grams = trigrams(term)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.trigram_tokens.get(gram, ()))
+        # Each edit breaks at most 3 trigrams, so closer tokens share at least this many
+        needed = max(1, len(grams) - 3 * max_edits)
+        matches = set()
+        for number, count in shared.items():
+            if count < needed:
+                continue
+            token = self.tokens[number]
+            for length in range(len(term) - max_edits, len(term) + max_edits + 1):
+                if 0 < length <= len(token) and edit_distance(term, token[:length], max_edits) <= max_edits:
+                    matches.add(number)
+                    break
+        return matches
+
+    def _union(self, numbers):
+        numbers = list(numbers)
+        if len(numbers) == 1:
+            return self.postings[numbers[0]]
+        return sorted(set().union(*(self.postings[n] for n in numbers)))
+
+    def _term_matcher(self, term):
+        """
+        (candidate count, docs() -> sorted candidate docs, matches(doc) -> bool,
+        exact token number or None) for one query term. docs() is only called for the
+        term with the fewest candidates, so wide prefixes are never materialized
+        unless they drive the query.
+        """
+        lo, hi = self._token_range(term)
+        exact = lo if lo < hi and self.tokens[lo] == term else None
+        if lo < hi:
+            if len(term) <= SHORT_PREFIX_LEN:
+                docs = self.prefix_docs.get(term, ())
+                count, get_docs = len(docs), lambda: docs
+            else:
+                count = sum(len(self.postings[n]) for n in range(lo, hi))
+                get_docs = lambda: self._union(range(lo, hi))
+            return count, get_docs, lambda doc: any(lo <= n < hi for n in self.doc_tokens[doc]), exact
+
+        if len(term) < MIN_FUZZY_LEN:
+            return 0, lambda: (), lambda doc: False, None
+        fuzzy = self._fuzzy_tokens(term)
+        count = sum(len(self.postings[n]) for n in fuzzy)
+        return count, lambda: self._union(fuzzy) if fuzzy else (), lambda doc: any(n in fuzzy for n in self.doc_tokens[doc]), None
+
+    def search(self, query, limit=DEFAULT_LIMIT):
+        """
+        Courses matching every query term as a token prefix (or, failing that, with a typo).
+        Courses with more exactly matching terms rank first, then by course ID.
+        Returns [(course_id, course_name), ...].
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        matchers = sorted((self._term_matcher(term) for term in terms), key=lambda m: m[0])
+        _, driver_docs, _, driver_exact = matchers[0]
+        driver_docs = driver_docs()
+        others = matchers[1:]
+
+        if not others:
+            # Single term: exact token hits first, then prefix hits, both already in ID order
+            exact_docs = self.postings[driver_exact][:limit] if driver_exact is not None else ()
+            results = list(exact_docs)
+            if len(results) < limit:
+                seen = set(results)
+                for doc in driver_docs:
+                    if doc not in seen:
+                        results.append(doc)
+                        if len(results) == limit:
+                            break
+            return [(self.doc_ids[doc], self.names[doc]) for doc in results]
+
+        exact_tokens = [exact for _, _, _, exact in matchers if exact is not None]
+        scored = []
+        for doc in driver_docs:
+            if all(matches(doc) for _, _, matches, _ in others):
+                doc_token_numbers = self.doc_tokens[doc]
+                score = sum(1 for exact in exact_tokens if exact in doc_token_numbers)
+                scored.append((-score, doc))
+        return [(self.doc_ids[doc], self.names[doc]) for _, doc in heapq.nsmallest(limit, scored)]
+
+# ---- BUILDING FROM FIRESTORE ---- #
+def initialize_firebase(credentials_path):
+    """Firestore client for the emulator when FIRESTORE_EMULATOR_HOST is set, else the project"""
+    emulator_db = emulator_client()
+    if emulator_db is not None:
+        return emulator_db
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app(credentials.Certificate(credentials_path))
+    return firestore.client()
+
+def iter_course_rows(db):
+    """One streaming pass over 'courses', reading only the fields the index uses"""
+    fields = ["course_name", "normalized_code", "searchable_fields"]
+    for doc in db.collection("courses").select(fields).stream():
+        data = doc.to_dict() or {}
+        yield doc.id, data.get("course_name", ""), data.get("normalized_code", ""), data.get("searchable_fields") or []
+
+def build_search_index(db, path=INDEX_FILE):
+    index = CourseSearchIndex.build(iter_course_rows(db))
+    index.save(path)
+    print(f"Indexed {len(index)} courses ({len(index.tokens)} tokens) into {path}")
+    return index
+
+# ---- RUN ---- #
+if __name__ == "__main__":
+    # python course_search.py build              (stream 'courses' into INDEX_FILE)
+    # python course_search.py "<query>"          (search the saved index)
+    if len(sys.argv) > 1 and sys.argv[1] == "build":
+        build_search_index(initialize_firebase("campusaid-afe4b-firebase-adminsdk-i2di4-4484b29e45.json"))
+    elif len(sys.argv) > 1:
+        for course_id, course_name in CourseSearchIndex.load().search(" ".join(sys.argv[1:])):
+            print(f"{course_id} - {course_name}")
+    else:
+        print('Usage: python course_search.py build | python course_search.py "<query>"')
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+
+from change_writer import ChangeWriter
+from write_engine import BulkWriteError
+
+def fingerprint(data, source_fields):
+    """Stable hash of the source field values of one document"""
+    values = [data.get(field) for field in source_fields]
+    return hashlib.sha1(json.dumps(values, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+class IncrementalDeriver:
+    """
+    Keeps fields derived from other fields of the same document (lowercase names,
+    search tokens) up to date without recomputing the whole collection every run.
+
+    A local JSON state file remembers a fingerprint of each document's source fields
+    as of its last successful write. Documents whose fingerprint is unchanged are
+    skipped without deriving anything; the rest are derived and written through a
+    ChangeWriter, so they go out in parallel batches via the shared WriteEngine.
+
+        deriver = IncrementalDeriver(db, "job_fingerprints.json", ["name"], ["lowercaseName"],
+                                     lambda data: {"lowercaseName": data.get("name", "").lower()})
+        for doc in db.collection("lecturers").select(deriver.read_fields).stream():
+            deriver.process(doc)
+        deriver.finish()
+
+    Incremental runs only read the source fields. The first run, a run after version
+    changes (bump it whenever derive changes) and a run with full=True read the stored
+    derived fields as well, and write only the documents whose stored values differ.
+    Use full=True to repair derived fields edited by something other than this job.
+    """
+    def __init__(self, db, state_file, source_fields, derived_fields, derive,
+                 version=1, unordered_fields=(), full=False):
+        self.state_file = state_file
+        self.source_fields = list(source_fields)
+        self.derived_fields = list(derived_fields)
+        self.derive = derive
+        self.version = version
+        self.writer = ChangeWriter(db, unordered_fields=unordered_fields)
+        self.fingerprints = {} if full else self._load()
+        self.full = not self.fingerprints
+        self.pending = {}  # Fingerprints of documents whose writes are not flushed yet
+        self.seen = set()
+        self.unchanged_inputs = 0
+
+    def _load(self):
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return {}
+        if state.get("version") != self.version or state.get("source_fields") != self.source_fields:
+            return {}
+        return state["fingerprints"]
+
+    def _save(self):
+        state = {"version": self.version, "source_fields": self.source_fields, "fingerprints": self.fingerprints}
+        # Write then rename, so a crash mid-write never leaves a corrupt state file
+        tmp_file = self.state_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_file, self.state_file)
+
+    @property
+    def read_fields(self):
+        """Field mask for the query: the stored derived fields are only needed on a full run"""
+        return self.source_fields + self.derived_fields if self.full else list(self.source_fields)
+
+    def process(self, snapshot):
+        """Derive and queue the fields of one document if its sources changed; returns the queued fields"""
+        data = snapshot.to_dict() or {}
+        doc_fingerprint = fingerprint(data, self.source_fields)
+        self.seen.add(snapshot.id)
+        if self.fingerprints.get(snapshot.id) == doc_fingerprint:
+            self.unchanged_inputs += 1
+            return {}
+
+        changed = self.writer.update(snapshot.reference, data, self.derive(data))
+        if changed:
+            self.pending[snapshot.id] = doc_fingerprint
+        else:
+            self.fingerprints[snapshot.id] = doc_fingerprint
+        return changed
+
+    def flush(self):
+        """
+        Wait for the queued writes and remember the fingerprints of the documents written.
+        Documents whose write failed keep their old fingerprint, so the next run retries them.
+        Raises BulkWriteError if any write failed permanently.
+        """
+        try:
+            self.writer.flush()
+        except BulkWriteError as e:
+            for failure in e.failures:
+                self.pending.pop(failure.operation.reference.id, None)
+            raise
+        finally:
+            self.fingerprints.update(self.pending)
+            self.pending = {}
+            self._save()
+
+    def finish(self, prune=True):
+        """
+        Flush, then forget deleted documents. Pass prune=False when this run did not
+        see the whole collection (e.g. it resumed from a checkpoint).
+        """
+        if prune:
+            self.fingerprints = {doc_id: fp for doc_id, fp in self.fingerprints.items() if doc_id in self.seen}
+        self.flush()
+
+    def summary(self):
+        return f"{self.writer.written} written, {self.writer.skipped} already up to date, {self.unchanged_inputs} with unchanged inputs"
@@ -0,0 +1,16 @@
+import os
+
+from firebase_admin import firestore
+
+# Set FIRESTORE_EMULATOR_HOST (e.g. "localhost:8080") to run against the local emulator
+EMULATOR_HOST = os.environ.get("FIRESTORE_EMULATOR_HOST")
+EMULATOR_PROJECT = os.environ.get("GCLOUD_PROJECT", "demo-firebase-scripts")
+
+def emulator_client():
+    """
+    Firestore client for the local emulator, or None when FIRESTORE_EMULATOR_HOST is unset.
+    The emulator needs no service account, so this skips firebase_admin entirely.
+    """
+    if not EMULATOR_HOST:
+        return None
+    return firestore.Client(project=EMULATOR_PROJECT)
@@ -0,0 +1,104 @@
+import concurrent.futures
+
+from google.cloud.firestore_v1.base_query import FieldFilter
+from tenacity import retry, stop_after_attempt, wait_exponential
+
+from change_writer import ChangeWriter
+
+# ---- CONFIGURATION ---- #
+MAX_WORKERS = 16  # Aggregation queries in flight at once
+RATING_FIELDS = ["rating", "totalRatings"]
+
+def rating_fields(total_ratings, rating_sum):
+    """Lecturer fields for total_ratings reviews whose ratings add up to rating_sum"""
+    avg_rating = round(rating_sum / total_ratings, 2) if total_ratings > 0 else 0
+    return {"totalRatings": total_ratings, "rating": avg_rating}
+
+def read_lecturer_ratings(db):
+    """{lecturer_id: (lecturer_ref, {rating field: stored value})} for every lecturer"""
+    lecturers = {}
+    for lecturer in db.collection("lecturers").select(RATING_FIELDS).stream():
+        data = lecturer.to_dict() or {}
+        lecturers[lecturer.id] = (lecturer.reference, {field: data.get(field) for field in RATING_FIELDS})
+    return lecturers
+
+# ---- AGGREGATION ENGINE ---- #
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
+def aggregate_ratings(reviews_ref):
+    """
+    (number of rated reviews, sum of their ratings) from one count() + sum() request.
+    Billed as one read per 1000 matching index entries instead of one per review.
+    """
+    query = reviews_ref.where(filter=FieldFilter("rating", "!=", None))
+    results = query.count(alias="total").sum("rating", alias="sum").get()
+    values = {result.alias: result.value for result in results[0]}
+    return int(values["total"]), values["sum"] or 0
+
+def update_ratings(db, max_workers=MAX_WORKERS):
+    """
+    Recomputes rating and totalRatings of every lecturer with a server-side aggregation
+    of its reviews sub-collection, max_workers lecturers at a time. Only lecturers whose
+    stored values differ are written. Returns the IDs of lecturers that could not be rated.
+    """
+    lecturers = read_lecturer_ratings(db)
+    writer = ChangeWriter(db)
+    failed = []
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(aggregate_ratings, lecturer_ref.collection("reviews")): lecturer_id
+            for lecturer_id, (lecturer_ref, _) in lecturers.items()
+        }
+        for future in concurrent.futures.as_completed(futures):
+            lecturer_id = futures[future]
+            lecturer_ref, stored = lecturers[lecturer_id]
+            try:
+                update_data = rating_fields(*future.result())
+            except Exception as e:
+                print(f"Error rating {lecturer_id}: {e}")
+                failed.append(lecturer_id)
+                continue
+            if writer.update(lecturer_ref, stored, update_data):
+                print(f"Updated {lecturer_id}: rating={update_data['rating']}, totalRatings={update_data['totalRatings']}")
+
+    writer.flush()
+    print(f"Lecturers {writer.summary()}, {len(failed)} failed")
+    return failed
+
+# ---- COLLECTION GROUP ENGINE ---- #
+def scan_review_ratings(db):
+    """
+    Rating count and sum per lecturer from one collection_group('reviews') stream,
+    reading only the rating field. One request stream instead of one per lecturer,
+    but every review is a billed read.
+    Returns {lecturer_id: (total_ratings, rating_sum)}.
+    """
+    ratings = {}
+    for review in db.collection_group("reviews").select(["rating"]).stream():
+        lecturer_ref = review.reference.parent.parent
+        # Same-named collections elsewhere in the database are not lecturer reviews
+        if lecturer_ref is None or lecturer_ref.parent.id != "lecturers":
+            continue
+        rating = (review.to_dict() or {}).get("rating")
+        if rating is None:
+            continue
+        total_ratings, rating_sum = ratings.get(lecturer_ref.id, (0, 0))
+        ratings[lecturer_ref.id] = (total_ratings + 1, rating_sum + rating)
+    return ratings
+
+def update_ratings_from_scan(db):
+    """Alternative engine: same result as update_ratings from a single collection_group scan"""
+    lecturers = read_lecturer_ratings(db)
+    ratings = scan_review_ratings(db)
+    writer = ChangeWriter(db)
+
+    for lecturer_id, (lecturer_ref, stored) in lecturers.items():
+        update_data = rating_fields(*ratings.get(lecturer_id, (0, 0)))
+        if writer.update(lecturer_ref, stored, update_data):
+            print(f"Updated {lecturer_id}: rating={update_data['rating']}, totalRatings={update_data['totalRatings']}")
+
+    writer.flush()
+    orphaned = set(ratings) - set(lecturers)
+    if orphaned:
+        print(f"Warning: reviews found under {len(orphaned)} missing lecturer docs: {sorted(orphaned)}")
+    print(f"Lecturers {writer.summary()}")
@@ -1,33 +1,29 @@
+import sys
 import firebase_admin
 from firebase_admin import credentials, firestore
-
-# Initialize Firebase Admin SDK
-cred = credentials.Certificate("campusaid-afe4b-firebase-adminsdk-i2di4-4484b29e45.json")  # Replace with your Firebase service account key
-firebase_admin.initialize_app(cred)
-
-db = firestore.client()
-
-def fix_lecturer_ratings():
-    lecturers_ref = db.collection("lecturers")
-    lecturers = lecturers_ref.stream()
-
-    for lecturer in lecturers:
-        lecturer_id = lecturer.id
-        reviews_ref = lecturers_ref.document(lecturer_id).collection("reviews")
-        reviews = reviews_ref.stream()
-
-        ratings = [review.get("rating") for review in reviews if review.get("rating") is not None]
-
-        total_ratings = len(ratings)
-        avg_rating = round(sum(ratings) / total_ratings, 2) if total_ratings > 0 else 0
-
-        # Update the lecturer document with correct values
-        lecturers_ref.document(lecturer_id).update({
-            "totalRatings": total_ratings,
-            "rating": avg_rating
-        })
-
-        print(f"Updated {lecturer.get('name')}: rating={avg_rating}, totalRatings={total_ratings}")
+from firestore_emulator import emulator_client
+from lecturer_ratings import update_ratings, update_ratings_from_scan
+
+# Use the local emulator when FIRESTORE_EMULATOR_HOST is set
+db = emulator_client()
+if db is None:
+    # Initialize Firebase Admin SDK
+    cred = credentials.Certificate("campusaid-afe4b-firebase-adminsdk-i2di4-4484b29e45.json")  # Replace with your Firebase service account key
+    firebase_admin.initialize_app(cred)
+
+    db = firestore.client()
+
+def fix_lecturer_ratings(engine="aggregate"):
+    """
+    Recomputes rating and totalRatings for every lecturer, writing only the ones that changed.
+    engine="aggregate" runs one count()/sum() query per lecturer in parallel;
+    engine="scan" reads every review once through collection_group('reviews').
+    """
+    if engine == "scan":
+        update_ratings_from_scan(db)
+    else:
+        update_ratings(db)
 
 # Run the script
-fix_lecturer_ratings()
+# Optional: python script10.py --scan
+fix_lecturer_ratings(engine="scan" if "--scan" in sys.argv else "aggregate")
@@ -1,7 +1,7 @@
 import firebase_admin
 from firebase_admin import credentials
 from firebase_admin import firestore
-import time
+from write_engine import SAFE_RETRY_CODES, WriteEngine, describe_failure
 
 # Initialize Firebase (replace path with your service account key file)
 cred = credentials.Certificate("campusaid-afe4b-firebase-adminsdk-i2di4-4484b29e45.json")
@@ -20,36 +20,23 @@ for user in users:
     user_data = user.to_dict()
     before_coins[user.id] = user_data.get('coins', 0)
 
-# Counter for modified documents
-modified_count = 0
-
-# Update each user's coins
-batch = db.batch()
-batch_size = 0
-max_batch_size = 500  # Firestore has a limit of 500 operations per batch
+# Update each user's coins; the write engine paces and retries the writes,
+# so no delay between batches is needed. Increment is not idempotent, so only
+# errors that guarantee the write was not applied are retried
+engine = WriteEngine(db, retry_codes=SAFE_RETRY_CODES)
 
 for user in users:
     user_ref = users_ref.document(user.id)
     
     # Use increment operation to add 10 coins
-    batch.update(user_ref, {'coins': firestore.Increment(10)})
-    batch_size += 1
-    modified_count += 1
-    
-    # Commit batch when reaching max size
-    if batch_size >= max_batch_size:
-        batch.commit()
-        print(f"Committed batch of {batch_size} updates")
-        batch = db.batch()  # Create new batch
-        batch_size = 0
-        time.sleep(1)  # Small delay to avoid hitting rate limits
-
-# Commit any remaining updates
-if batch_size > 0:
-    batch.commit()
-    print(f"Committed final batch of {batch_size} updates")
-
-print(f"Updated coins for {modified_count} users")
+    engine.update(user_ref, {'coins': firestore.Increment(10)})
+
+# Wait for all updates to finish
+failures = engine.close()
+for failure in failures:
+    print(f"Failed to update {describe_failure(failure)}")
+
+print(f"Updated coins for {engine.written} users")
 
 # Get updated user data and display before and after values
 print("\nSample of updated users:")
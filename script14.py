@@ -1,15 +1,31 @@
 import firebase_admin
 from firebase_admin import credentials, firestore
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import hashlib
 from PIL import Image
 from io import BytesIO
 import imagehash
+import pymupdf  # Reads PDF text and rasterizes scanned pages for similarity hashing
 import concurrent.futures
 import logging
-import time
+import multiprocessing
+import os
+import json
+import queue
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
 from collections import defaultdict
-from functools import lru_cache
+from math import ceil
+from datetime import datetime
+import numpy as np
+from tenacity import retry, stop_after_attempt, wait_exponential
+from google.cloud.firestore_v1.base_query import FieldFilter
+from write_engine import WriteEngine, describe_failure
 
 # Set up logging
 logging.basicConfig(
@@ -33,10 +49,29 @@ def initialize_firebase():
 
 # ---- SUBCOLLECTIONS ---- #
 SUBCOLLECTIONS = ['end-semester', 'mid-semester', 'quizzes']
-HAMMING_THRESHOLD = 5  # Configurable threshold for image similarity
+HAMMING_THRESHOLD = 5  # Max differing pHash bits for image similarity
 MAX_RETRIES = 3        # Number of retries for network operations
-BATCH_SIZE = 300       # Maximum number of operations per batch
-MAX_WORKERS = 5       # Maximum number of parallel workers
+MAX_WORKERS = 5       # Maximum number of parallel download threads
+HASH_WORKERS = os.cpu_count() or 1  # Processes decoding images and computing pHashes
+# Hash workers are started from download threads while gRPC channels and BulkWriter
+# threads are live; forking that state can hang the children, so start them fresh
+HASH_POOL_START_METHOD = "spawn"
+QUEUE_SIZE = 100      # Files buffered between pipeline stages
+FLUSH_INTERVAL = 5    # Seconds without new results before queued writes are flushed
+FLUSH_WRITES = 500    # Queued writes that trigger a flush even while results keep arriving
+HASH_CACHE_PATH = "file_hash_cache.db"  # Local URL -> hash cache, persists between runs
+CHUNK_SIZE = 64 * 1024               # Bytes read from the network per hashing step
+MAX_IMAGE_BYTES = 20 * 1024 * 1024   # Largest image buffered in memory for a pHash
+PDF_HASH_PAGES = 3    # Leading PDF pages fingerprinted for similarity (0 disables PDF similarity)
+PDF_DPI = 36          # Rasterization resolution for scanned pages; pHash only needs a coarse image
+MIN_PAGE_WORDS = 20   # Pages with fewer extractable words are treated as scans
+PDF_MATCH_RATIO = 0.6  # Share of a PDF's pages that must match one stored PDF to flag it similar
+REVALIDATE_CACHE = False  # Re-check cached URLs with conditional requests instead of trusting them
+WATERMARK_FILE = "dedup_watermark.txt"  # Newest paper timestamp handled by incremental runs
+RETRY_FILE = "dedup_retry.json"         # Files that failed in incremental runs, retried on the next ones
+MAX_RETRY_RUNS = 5                      # Runs a file may fail before it is dropped from RETRY_FILE
+# Paper fields that order uploads: older papers carry uploadedAt, newer ones only createdAt
+WATERMARK_FIELDS = ("uploadedAt", "createdAt")
 
 # ---- HASH HELPERS ---- #
 def get_sha256(content):
@@ -51,83 +86,577 @@ def get_phash(image_bytes):
         logger.warning(f"Could not generate perceptual hash: {e}")
         return None
 
-@lru_cache(maxsize=1000)
-def hamming_distance(str1, str2):
-    return sum(c1 != c2 for c1, c2 in zip(str1, str2))
+def get_simhash(words, shingle_size=3):
+    """64-bit SimHash of a token sequence's word shingles, as a hex string like a pHash"""
+    shingles = [" ".join(words[i:i + shingle_size]) for i in range(max(1, len(words) - shingle_size + 1))]
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "big") for shingle in shingles],
+        dtype=np.uint64
+    )
+    bits = (hashes[:, None] >> np.arange(64, dtype=np.uint64)) & np.uint64(1)
+    weights = 2 * bits.sum(axis=0, dtype=np.int64) - len(shingles)
+    value = sum(1 << i for i in range(64) if weights[i] > 0)
+    return f"{value:016x}"
+
+def get_pdf_page_hashes(pdf_path, max_pages=PDF_HASH_PAGES, dpi=PDF_DPI):
+    """
+    64-bit fingerprint of each of the first max_pages pages: a SimHash of the page text
+    when it has a text layer, otherwise a pHash of the page rasterized at low DPI.
+    Rasterized text pages all look alike to a pHash, so text is preferred whenever present.
+    """
+    try:
+        zoom = dpi / 72
+        page_hashes = []
+        with pymupdf.open(pdf_path) as document:
+            for page_number in range(min(max_pages, document.page_count)):
+                page = document.load_page(page_number)
+                words = re.findall(r"\w+", page.get_text().lower())
+                if len(words) >= MIN_PAGE_WORDS:
+                    page_hashes.append(get_simhash(words))
+                    continue
+                pixmap = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), colorspace=pymupdf.csRGB, alpha=False)
+                image = Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
+                low, high = image.convert("L").getextrema()
+                if high - low < 16:
+                    continue  # Blank pages all share one pHash and would match every PDF
+                page_hashes.append(str(imagehash.phash(image)))
+        return page_hashes
+    except Exception as e:
+        logger.warning(f"Could not generate PDF page hashes: {e}")
+        return []
+
+def is_pdf(url, content_type=""):
+    return content_type.startswith('application/pdf') or url.lower().endswith('.pdf')
+
+def phash_to_int(phash):
+    """Convert a hex pHash string (as stored in fileHashes) to a 64-bit int"""
+    return int(phash, 16)
+
+def bit_distance(a, b):
+    """Number of differing bits between two integer hashes"""
+    return bin(a ^ b).count("1")
+
+def hamming_distance(phash1, phash2):
+    """Bitwise Hamming distance between two hex pHash strings"""
+    return bit_distance(phash_to_int(phash1), phash_to_int(phash2))
+
+# ---- VECTORIZED HAMMING ENGINE ---- #
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def popcount64(values):
+    """Per-element set-bit count of a uint64 array"""
+    if hasattr(np, "bitwise_count"):  # NumPy >= 2.0
+        return np.bitwise_count(values).astype(np.uint8)
+    as_bytes = np.ascontiguousarray(values).view(np.uint8).reshape(values.shape + (8,))
+    return _POPCOUNT_TABLE[as_bytes].sum(axis=-1, dtype=np.uint8)
+
+class PHashMatrix:
+    """
+    All pHashes packed into one uint64 array so that distances from a query to every
+    stored hash, or between all pairs of hashes, are a single XOR + popcount.
+    Meant for bulk/offline sweeps; ImageHashStore remains the incremental index.
+    """
+    def __init__(self, capacity=1024):
+        self.hashes = np.zeros(capacity, dtype=np.uint64)
+        self.items = []
+
+    def __len__(self):
+        return len(self.items)
+
+    @classmethod
+    def from_records(cls, records, key="pHash"):
+        """Build from fileHashes-style dicts, skipping records without a pHash"""
+        matrix = cls()
+        for record in records:
+            if record.get(key):
+                matrix.add(record[key], record)
+        return matrix
+
+    def add(self, phash, item):
+        count = len(self.items)
+        if count == len(self.hashes):
+            self.hashes = np.concatenate([self.hashes, np.zeros(max(count, 1), dtype=np.uint64)])
+        self.hashes[count] = phash_to_int(phash)
+        self.items.append(item)
+
+    def distances(self, phash):
+        """Bit-accurate distance from phash to every stored hash, in insertion order"""
+        active = self.hashes[:len(self.items)]
+        return popcount64(np.bitwise_xor(active, np.uint64(phash_to_int(phash))))
+
+    def query(self, phash, threshold=HAMMING_THRESHOLD):
+        """Return (distance, item) pairs within threshold, closest first"""
+        distances = self.distances(phash)
+        indices = np.flatnonzero(distances <= threshold)
+        indices = indices[np.argsort(distances[indices], kind="stable")]
+        return [(int(distances[i]), self.items[i]) for i in indices]
+
+    def pairs_within(self, threshold=HAMMING_THRESHOLD, block_size=2048):
+        """
+        Yield (i, j, distance) for every pair i < j within threshold.
+        Works on block_size x block_size tiles so memory stays bounded for large corpora.
+        """
+        active = self.hashes[:len(self.items)]
+        count = len(active)
+        for row_start in range(0, count, block_size):
+            rows = active[row_start:row_start + block_size]
+            for col_start in range(row_start, count, block_size):
+                cols = active[col_start:col_start + block_size]
+                distances = popcount64(np.bitwise_xor(rows[:, None], cols[None, :]))
+                row_idx, col_idx = np.nonzero(distances <= threshold)
+                row_abs = row_idx + row_start
+                col_abs = col_idx + col_start
+                upper = col_abs > row_abs
+                for i, j, d in zip(row_abs[upper], col_abs[upper], distances[row_idx[upper], col_idx[upper]]):
+                    yield int(i), int(j), int(d)
+
+# ---- PERCEPTUAL HASH INDEX ---- #
+class MultiIndexHash:
+    """
+    Multi-index hashing over 64-bit integer pHashes.
+    Each hash is split into radius + 1 disjoint bit chunks, one lookup table per chunk.
+    By the pigeonhole principle any hash within `radius` bits of a query matches it
+    exactly on at least one chunk, so a radius query only verifies the few entries
+    sharing a bucket instead of scanning every stored hash.
+    """
+    def __init__(self, radius=HAMMING_THRESHOLD, bits=64):
+        self.radius = radius
+        chunk_count = radius + 1
+        self.chunks = []  # (shift, mask) per chunk
+        shift = 0
+        for i in range(chunk_count):
+            width = bits // chunk_count + (1 if i < bits % chunk_count else 0)
+            self.chunks.append((shift, (1 << width) - 1))
+            shift += width
+        self.tables = [defaultdict(list) for _ in self.chunks]
+        self.values = []
+        self.items = []
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, value, item):
+        entry_id = len(self.values)
+        self.values.append(value)
+        self.items.append(item)
+        for table, (shift, mask) in zip(self.tables, self.chunks):
+            table[(value >> shift) & mask].append(entry_id)
+
+    def query(self, value, radius=None):
+        """Return (distance, item) pairs within radius, closest first"""
+        radius = self.radius if radius is None else radius
+        if radius > self.radius:
+            return self._scan(value, radius)
+
+        seen = set()
+        matches = []
+        for table, (shift, mask) in zip(self.tables, self.chunks):
+            for entry_id in table.get((value >> shift) & mask, ()):
+                if entry_id in seen:
+                    continue
+                seen.add(entry_id)
+                distance = bit_distance(value, self.values[entry_id])
+                if distance <= radius:
+                    matches.append((distance, entry_id))
+
+        matches.sort()
+        return [(distance, self.items[entry_id]) for distance, entry_id in matches]
+
+    def nearest(self, value, k=1, max_distance=64):
+        """Return up to k (distance, item) pairs closest to value"""
+        matches = self.query(value, min(max_distance, self.radius))
+        if len(matches) >= k or max_distance <= self.radius:
+            return matches[:k]
+        # Fewer than k hashes inside the indexed radius: fall back to a full scan
+        return self._scan(value, max_distance)[:k]
+
+    def _scan(self, value, radius):
+        matches = []
+        for entry_id, stored in enumerate(self.values):
+            distance = bit_distance(value, stored)
+            if distance <= radius:
+                matches.append((distance, entry_id))
+        matches.sort()
+        return [(distance, self.items[entry_id]) for distance, entry_id in matches]
 
 # ---- EFFICIENT IMAGE HASH STORAGE ---- #
 class ImageHashStore:
-    def __init__(self):
-        self.hashes = []
-        
+    def __init__(self, threshold=HAMMING_THRESHOLD):
+        self.threshold = threshold
+        self.index = MultiIndexHash(threshold)
+
+    def __len__(self):
+        return len(self.index)
+
     def add(self, phash, url, paper_doc_id):
-        self.hashes.append({
+        self.index.add(phash_to_int(phash), {
             "phash": phash,
             "url": url,
             "paperDocId": paper_doc_id
         })
-        
-    def find_similar(self, phash, threshold=HAMMING_THRESHOLD):
-        for item in self.hashes:
-            if hamming_distance(item["phash"], phash) <= threshold:
-                return item
+
+    def find_similar(self, phash, threshold=None):
+        threshold = self.threshold if threshold is None else threshold
+        matches = self.index.query(phash_to_int(phash), threshold)
+        return matches[0][1] if matches else None
+
+    def find_nearest(self, phash, k=1, threshold=None):
+        max_distance = 64 if threshold is None else threshold
+        return self.index.nearest(phash_to_int(phash), k, max_distance)
+
+    def add_pages(self, page_hashes, url, paper_doc_id):
+        for page_hash in page_hashes:
+            self.add(page_hash, url, paper_doc_id)
+
+    def find_similar_pages(self, page_hashes, threshold=None, ratio=PDF_MATCH_RATIO):
+        """
+        Match a PDF by its page hashes. A stored file is similar only when at least
+        `ratio` of the pages find a near match in it, so a shared cover sheet alone
+        does not make two different papers duplicates.
+        """
+        threshold = self.threshold if threshold is None else threshold
+        votes = defaultdict(int)
+        first_match = {}
+        for page_hash in page_hashes:
+            voted = set()
+            for _, item in self.index.query(phash_to_int(page_hash), threshold):
+                if item["url"] not in voted:
+                    voted.add(item["url"])
+                    votes[item["url"]] += 1
+                    first_match.setdefault(item["url"], item)
+        if not votes:
+            return None
+        best_url = max(votes, key=votes.get)
+        if votes[best_url] >= max(1, ceil(ratio * len(page_hashes))):
+            return first_match[best_url]
         return None
 
+# ---- CONCURRENT DEDUP INDEX ---- #
+class DedupIndex:
+    """
+    Exact-hash map and similarity index shared by all process_file workers.
+    Each file is looked up and, if it matches nothing, inserted under a single lock,
+    so two identical files processed at the same time cannot both miss: whichever
+    claims first is the original and the other gets it back as its match.
+    """
+    def __init__(self, threshold=HAMMING_THRESHOLD):
+        self.lock = threading.Lock()
+        self.file_hashes = {}                          # For exact duplicates
+        self.image_hashes = ImageHashStore(threshold)  # For perceptual duplicates
+
+    def claim(self, file_hash, url, paper_doc_id, phash=None, page_hashes=None):
+        """
+        Atomically insert-if-absent. Returns (exact_match, similar_match) against
+        the files claimed before this one; unmatched hashes are added to the index.
+        """
+        with self.lock:
+            exact_match = self.file_hashes.get(file_hash)
+            if not exact_match:
+                self.file_hashes[file_hash] = {
+                    "url": url,
+                    "paperDocId": paper_doc_id
+                }
+            
+            similar_match = None
+            if phash:
+                similar_match = self.image_hashes.find_similar(phash)
+                if not similar_match:
+                    self.image_hashes.add(phash, url, paper_doc_id)
+            elif page_hashes:
+                similar_match = self.image_hashes.find_similar_pages(page_hashes)
+                if not similar_match:
+                    self.image_hashes.add_pages(page_hashes, url, paper_doc_id)
+            return exact_match, similar_match
+
+    def add_existing(self, file_hash, url, paper_doc_id, phash=None, page_hashes=None):
+        """Load a previously recorded file without matching it"""
+        with self.lock:
+            self.file_hashes.setdefault(file_hash, {"url": url, "paperDocId": paper_doc_id})
+            if phash:
+                self.image_hashes.add(phash, url, paper_doc_id)
+            if page_hashes:
+                self.image_hashes.add_pages(page_hashes, url, paper_doc_id)
+
+# ---- PERSISTENT HASH CACHE ---- #
+class HashCache:
+    """
+    SQLite-backed cache of fileUrl -> (fileHash, pHash, paperDocId), plus the
+    ETag/Last-Modified validators the file was served with.
+    Cloudinary URLs are versioned, so a URL that was hashed once normally never
+    needs to be downloaded again; with REVALIDATE_CACHE the validators turn a
+    re-check into a bodiless 304.
+    """
+    COLUMNS = ("file_url", "file_hash", "phash", "paper_doc_id", "etag", "last_modified")
+
+    def __init__(self, path=HASH_CACHE_PATH):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS file_hashes ("
+            "file_url TEXT PRIMARY KEY, file_hash TEXT NOT NULL, phash TEXT, paper_doc_id TEXT)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS pdf_page_hashes (file_hash TEXT PRIMARY KEY, page_hashes TEXT NOT NULL)"
+        )
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(file_hashes)")]
+        for column in self.COLUMNS:
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE file_hashes ADD COLUMN {column} TEXT")
+        self.conn.commit()
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM file_hashes").fetchone()[0]
+
+    def __bool__(self):
+        # A fresh, empty cache is still a cache to fill, not a missing one
+        return True
+
+    def get(self, url):
+        """Return (fileHash, pHash, etag, lastModified) for a known URL, or None"""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT file_hash, phash, etag, last_modified FROM file_hashes WHERE file_url = ?", (url,)
+            ).fetchone()
+
+    def put(self, url, file_hash, phash, paper_doc_id=None, etag=None, last_modified=None):
+        with self.lock:
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO file_hashes ({', '.join(self.COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?)",
+                (url, file_hash, phash, paper_doc_id, etag, last_modified)
+            )
+            self.conn.commit()
+
+    def put_many(self, rows):
+        """Insert (fileUrl, fileHash, pHash, paperDocId) rows, skipping incomplete ones; returns rows stored"""
+        rows = [row for row in rows if row[0] and row[1]]
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO file_hashes (file_url, file_hash, phash, paper_doc_id) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self.conn.commit()
+        return len(rows)
+
+    def get_page_hashes(self, file_hash):
+        """Return the cached page hashes of a PDF, or None if it was never fingerprinted"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT page_hashes FROM pdf_page_hashes WHERE file_hash = ?", (file_hash,)
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0].split(",") if row[0] else []
+
+    def put_page_hashes(self, file_hash, page_hashes):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO pdf_page_hashes VALUES (?, ?)", (file_hash, ",".join(page_hashes))
+            )
+            self.conn.commit()
+
+    def seed_from_firestore(self, db):
+        """Load every hash already recorded in the fileHashes collection"""
+        docs = db.collection('fileHashes').select(
+            ['fileUrl', 'fileHash', 'pHash', 'paperDocId', 'pageHashes']
+        ).stream()
+        return self._seed(doc.to_dict() for doc in docs)
+
+    def seed_from_export(self, path):
+        """Load hashes from a fileHashes export written by script19.py"""
+        with open(path, "r", encoding="utf-8") as f:
+            records = json.load(f)
+        return self._seed(records)
+
+    def _seed(self, records):
+        rows = []
+        for record in records:
+            rows.append(_cache_row(record))
+            if record.get('fileHash') and record.get('pageHashes') is not None:
+                self.put_page_hashes(record['fileHash'], record['pageHashes'])
+        return self.put_many(rows)
+
+    def build_index(self, exclude_urls=()):
+        """
+        Rebuild a DedupIndex from every cached file, leaving out URLs that are
+        about to be processed again.
+        """
+        dedup_index = DedupIndex()
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT f.file_url, f.file_hash, f.phash, f.paper_doc_id, p.page_hashes "
+                "FROM file_hashes f LEFT JOIN pdf_page_hashes p ON f.file_hash = p.file_hash"
+            ).fetchall()
+        for url, file_hash, phash, paper_doc_id, page_hashes in rows:
+            if url in exclude_urls:
+                continue
+            dedup_index.add_existing(
+                file_hash, url, paper_doc_id, phash, page_hashes.split(",") if page_hashes else None
+            )
+        return dedup_index
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+def _cache_row(record):
+    return (record.get('fileUrl'), record.get('fileHash'), record.get('pHash'), record.get('paperDocId'))
+
 # ---- FILE PROCESSING ---- #
-def download_file(url, retries=MAX_RETRIES):
-    for attempt in range(retries):
-        try:
-            response = requests.get(url, timeout=30)
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """
+    Shared keep-alive session for all download threads.
+    The connection pool is sized to MAX_WORKERS so every thread reuses an open
+    TLS connection to res.cloudinary.com, and retries with exponential backoff
+    are handled by urllib3.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total=MAX_RETRIES,
+                backoff_factor=1,
+                status_forcelist=[429, 500, 502, 503, 504],
+                allowed_methods=["GET"]
+            )
+            adapter = HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS, max_retries=retry)
+            _session = requests.Session()
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+def download_and_hash(url, etag=None, last_modified=None):
+    """
+    Stream a file, feeding SHA-256 chunk by chunk so only CHUNK_SIZE bytes are held
+    at a time. The body is kept only for images, which need it for a pHash, and only
+    up to MAX_IMAGE_BYTES. PDFs are spooled to a temporary file for fingerprinting;
+    the caller removes it.
+    Returns (file_hash, content_type, image_bytes, pdf_path, etag, last_modified), or
+    None when validators were given and the file is unchanged (HTTP 304).
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    
+    try:
+        with get_session().get(url, headers=headers, timeout=30, stream=True) as response:
+            if response.status_code == 304:
+                return None
             response.raise_for_status()
-            return response.content, response.headers.get("Content-Type", "")
-        except requests.exceptions.RequestException as e:
-            if attempt < retries - 1:
-                wait_time = 2 ** attempt  # Exponential backoff
-                logger.warning(f"Attempt {attempt+1} failed for {url}: {e}. Retrying in {wait_time}s...")
-                time.sleep(wait_time)
-            else:
-                logger.error(f"Failed to download {url} after {retries} attempts: {e}")
+            
+            content_type = response.headers.get("Content-Type", "")
+            keep_body = content_type.startswith('image/')
+            spool = None
+            if PDF_HASH_PAGES and is_pdf(url, content_type):
+                spool = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+            sha256 = hashlib.sha256()
+            buffer = bytearray()
+            try:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    sha256.update(chunk)
+                    if spool:
+                        spool.write(chunk)
+                    elif keep_body:
+                        buffer.extend(chunk)
+                        if len(buffer) > MAX_IMAGE_BYTES:
+                            logger.warning(f"Image larger than {MAX_IMAGE_BYTES} bytes, skipping pHash: {url}")
+                            keep_body = False
+                            buffer = bytearray()
+            except Exception:
+                if spool:
+                    spool.close()
+                    os.remove(spool.name)
                 raise
+            if spool:
+                spool.close()
+            
+            return (
+                sha256.hexdigest(),
+                content_type,
+                bytes(buffer) if keep_body else None,
+                spool.name if spool else None,
+                response.headers.get("ETag"),
+                response.headers.get("Last-Modified")
+            )
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Failed to download {url} after {MAX_RETRIES} retries: {e}")
+        raise
                 
-def process_file(url, course_id, sub, paper_doc_id, paper_data, file_hash_map, image_hash_store):
+def process_file(url, course_id, sub, paper_doc_id, paper_data, dedup_index,
+                 hash_cache=None, hash_pool=None):
     try:
-        content, content_type = download_file(url)
-        file_hash = get_sha256(content)
+        cached = hash_cache.get(url) if hash_cache is not None else None
+        page_hashes = None
+        if cached and PDF_HASH_PAGES and is_pdf(url):
+            page_hashes = hash_cache.get_page_hashes(cached[0])
+        
+        download = None
+        if cached and REVALIDATE_CACHE and (cached[2] or cached[3]):
+            # Conditional GET: an unchanged file comes back as a 304 without a body
+            download = download_and_hash(url, cached[2], cached[3])
+        elif not cached or (PDF_HASH_PAGES and is_pdf(url) and page_hashes is None):
+            # Unknown file, or a cached PDF hashed before page fingerprints existed
+            download = download_and_hash(url)
+        from_cache = download is None
         
-        # Check for exact match
-        exact_match = file_hash_map.get(file_hash)
+        if from_cache:
+            file_hash, current_phash = cached[0], cached[1]
+        else:
+            # hashlib releases the GIL, so SHA-256 is computed on the download thread
+            file_hash, content_type, image_bytes, pdf_path, etag, last_modified = download
+            current_phash = None
+            page_hashes = None
+            try:
+                # Image decoding, PDF fingerprinting and pHash are CPU-bound: run them in the process pool
+                if image_bytes:
+                    if hash_pool:
+                        current_phash = hash_pool.submit(get_phash, image_bytes).result()
+                    else:
+                        current_phash = get_phash(image_bytes)
+                if pdf_path:
+                    # Re-uploads of the same PDF are fingerprinted only once
+                    if hash_cache is not None:
+                        page_hashes = hash_cache.get_page_hashes(file_hash)
+                    if page_hashes is None:
+                        if hash_pool:
+                            page_hashes = hash_pool.submit(get_pdf_page_hashes, pdf_path).result()
+                        else:
+                            page_hashes = get_pdf_page_hashes(pdf_path)
+                        if hash_cache is not None:
+                            hash_cache.put_page_hashes(file_hash, page_hashes)
+            finally:
+                if pdf_path:
+                    os.remove(pdf_path)
+            if hash_cache is not None:
+                hash_cache.put(url, file_hash, current_phash, paper_doc_id, etag, last_modified)
         
-        # Check image similarity if it's an image
-        similar_match = None
-        current_phash = None
-        if content_type.startswith('image/'):
-            current_phash = get_phash(content)
-            if current_phash:
-                similar_match = image_hash_store.find_similar(current_phash)
+        # Check for exact and near matches (image pHash, or page-by-page for PDFs),
+        # registering this file for future comparisons if it is new
+        exact_match, similar_match = dedup_index.claim(
+            file_hash, url, paper_doc_id, current_phash, page_hashes
+        )
         
         result = {
             "fileUrl": url,
             "fileHash": file_hash,
             "pHash": current_phash,
+            "pageHashes": page_hashes,
             "courseId": course_id,
             "subcollection": sub,
             "paperDocId": paper_doc_id,
             "paperData": paper_data,
             "exactMatch": exact_match,
-            "similarMatch": similar_match
+            "similarMatch": similar_match,
+            "cached": from_cache
         }
-        
-        # Update our maps for future comparisons
-        if not exact_match:
-            file_hash_map[file_hash] = {
-                "url": url,
-                "paperDocId": paper_doc_id
-            }
-            
-        if current_phash and not similar_match:
-            image_hash_store.add(current_phash, url, paper_doc_id)
             
-        logger.info(f"✓ Processed: {url}")
+        logger.info(f"✓ Processed: {url}{' (cached)' if from_cache else ''}")
         return result
         
     except Exception as e:
@@ -141,167 +670,431 @@ def process_file(url, course_id, sub, paper_doc_id, paper_data, file_hash_map, i
         }
 
 # ---- BATCH WRITE OPERATIONS ---- #
-def write_batched_documents(db, results):
-    """Write results to Firestore in batches"""
-    file_hashes_batch = db.batch()
-    duplicates_batch = db.batch()
+def build_documents(result):
+    """Return the fileHashes document and, if the file is a duplicate, its duplicates document"""
+    file_hash_data = {
+        "fileUrl": result["fileUrl"],
+        "fileHash": result["fileHash"],
+        "pHash": result["pHash"],
+        "courseId": result["courseId"],
+        "subcollection": result["subcollection"],
+        "paperDocId": result["paperDocId"],
+        **result["paperData"]
+    }
+    if result.get("pageHashes") is not None:
+        file_hash_data["pageHashes"] = result["pageHashes"]
     
-    file_hash_count = 0
-    duplicate_count = 0
-    
-    for result in results:
-        if "error" in result:
-            continue
-            
-        # Add to fileHashes collection
-        doc_ref = db.collection('fileHashes').document()
-        file_hash_data = {
-            "fileUrl": result["fileUrl"],
+    duplicate_data = None
+    if result["exactMatch"]:
+        duplicate_data = {
+            "type": "exact",
+            "duplicateFileUrl": result["fileUrl"],
+            "matchedFileUrl": result["exactMatch"]["url"],
             "fileHash": result["fileHash"],
+            "courseId": result["courseId"],
+            "subcollection": result["subcollection"],
+            "paperDocId": result["paperDocId"],
+            "matchedPaperDocId": result["exactMatch"]["paperDocId"],
+            **result["paperData"]
+        }
+    elif result["similarMatch"]:
+        duplicate_data = {
+            "type": "similar",
+            "duplicateFileUrl": result["fileUrl"],
+            "matchedFileUrl": result["similarMatch"]["url"],
             "pHash": result["pHash"],
+            "similarToPHash": result["similarMatch"]["phash"],
             "courseId": result["courseId"],
             "subcollection": result["subcollection"],
             "paperDocId": result["paperDocId"],
+            "matchedPaperDocId": result["similarMatch"]["paperDocId"],
             **result["paperData"]
         }
-        file_hashes_batch.set(doc_ref, file_hash_data)
-        file_hash_count += 1
+        if result.get("pageHashes"):
+            duplicate_data["pageHashes"] = result["pageHashes"]
+    return file_hash_data, duplicate_data
+
+@retry(stop=stop_after_attempt(MAX_RETRIES), wait=wait_exponential(multiplier=1, min=2, max=10), reraise=True)
+def commit_batch(batch):
+    """Commits a WriteBatch with retry logic; its set() writes target fixed refs, so a retry is idempotent"""
+    batch.commit()
+
+class DuplicateWriter:
+    """
+    Queues fileHashes writes on the shared WriteEngine, which sends them in parallel batches.
+    A duplicate's fileHashes and duplicates documents are committed together in one WriteBatch,
+    so a file is never recorded as hashed while its duplicate record is missing.
+    """
+    def __init__(self, db):
+        self.db = db
+        self.engine = WriteEngine(db)
+        self.pending = 0
+        self.stats = defaultdict(int)
+        self.queued = {}        # Document path -> file it was written for, until the next flush
+        self.failed_files = {}  # fileUrl -> (courseId, subcollection, paperDocId) of files not fully recorded
+
+    def _file_key(self, result):
+        return result["fileUrl"], (result["courseId"], result["subcollection"], result["paperDocId"])
+
+    def add(self, result):
+        self.stats["processed"] += 1
+        if result.get("cached"):
+            self.stats["cached"] += 1
+        if "error" in result:
+            self.stats["errors"] += 1
+            url, paper_key = self._file_key(result)
+            self.failed_files[url] = paper_key
+            return
         
-        # If we hit the batch limit, commit and reset
-        if file_hash_count >= BATCH_SIZE:
-            file_hashes_batch.commit()
-            file_hashes_batch = db.batch()
-            file_hash_count = 0
-            
-        # Check for and record exact duplicates
-        if result["exactMatch"]:
-            doc_ref = db.collection('duplicates').document()
-            duplicate_data = {
-                "type": "exact",
-                "duplicateFileUrl": result["fileUrl"],
-                "matchedFileUrl": result["exactMatch"]["url"],
-                "fileHash": result["fileHash"],
-                "courseId": result["courseId"],
-                "subcollection": result["subcollection"],
-                "paperDocId": result["paperDocId"],
-                "matchedPaperDocId": result["exactMatch"]["paperDocId"],
-                **result["paperData"]
-            }
-            duplicates_batch.set(doc_ref, duplicate_data)
-            duplicate_count += 1
-            
-        # Check for and record similar images
-        elif result["similarMatch"]:
-            doc_ref = db.collection('duplicates').document()
-            duplicate_data = {
-                "type": "similar",
-                "duplicateFileUrl": result["fileUrl"],
-                "matchedFileUrl": result["similarMatch"]["url"],
-                "pHash": result["pHash"],
-                "similarToPHash": result["similarMatch"]["phash"],
-                "courseId": result["courseId"],
-                "subcollection": result["subcollection"],
-                "paperDocId": result["paperDocId"],
-                "matchedPaperDocId": result["similarMatch"]["paperDocId"],
-                **result["paperData"]
-            }
-            duplicates_batch.set(doc_ref, duplicate_data)
-            duplicate_count += 1
-            
-        # If we hit the batch limit, commit and reset
-        if duplicate_count >= BATCH_SIZE:
-            duplicates_batch.commit()
-            duplicates_batch = db.batch()
-            duplicate_count = 0
+        file_hash_data, duplicate_data = build_documents(result)
+        file_key = self._file_key(result)
+        file_hash_ref = self.db.collection('fileHashes').document()
+        if duplicate_data:
+            self._write_duplicate(file_key, file_hash_ref, file_hash_data, duplicate_data)
+            return
+        self.engine.set(file_hash_ref, file_hash_data)
+        self.queued[file_hash_ref.path] = file_key
+        self.pending += 1
+        self.stats["file_hashes"] += 1
+        # Flushing on a busy run too keeps queued bounded and surfaces failures as they happen
+        if self.pending >= FLUSH_WRITES:
+            self.flush()
+
+    def _write_duplicate(self, file_key, file_hash_ref, file_hash_data, duplicate_data):
+        batch = self.db.batch()
+        batch.set(file_hash_ref, file_hash_data)
+        batch.set(self.db.collection('duplicates').document(), duplicate_data)
+        try:
+            commit_batch(batch)
+        except Exception as e:
+            url, paper_key = file_key
+            logger.error(f"Failed to write the duplicate records of {url}: {e}")
+            self.failed_files[url] = paper_key
+            self.stats["write_errors"] += 2
+            return
+        self.stats["file_hashes"] += 1
+        self.stats["duplicates"] += 1
+
+    def flush(self):
+        """Wait until every queued write has landed or permanently failed; returns the failures"""
+        if not self.pending:
+            return []
+        failures = self.engine.flush()
+        for failure in failures:
+            logger.error(f"Failed to write {describe_failure(failure)}")
+            url, paper_key = self.queued[failure.operation.reference.path]
+            self.failed_files[url] = paper_key
+        self.stats["write_errors"] += len(failures)
+        self.queued = {}
+        logger.info(f"Committed {self.pending - len(failures)} writes")
+        self.pending = 0
+        return failures
+
+    def close(self):
+        """Flush, then shut the WriteEngine down; returns the failures"""
+        return self.flush() + self.engine.close()
+
+def make_hash_pool():
+    """Process pool for pHash/PDF fingerprinting, started without fork"""
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=HASH_WORKERS,
+        mp_context=multiprocessing.get_context(HASH_POOL_START_METHOD)
+    )
+
+# ---- STREAMING PIPELINE ---- #
+_DONE = object()  # End-of-stream marker passed between stages
+
+def _put(q, item, stop):
+    """Blocking put that gives up once the pipeline is stopping"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def run_pipeline(db, tasks, dedup_index, hash_cache, hash_pool=None):
+    """
+    Stream tasks through enumerate -> download -> hash -> write stages joined by bounded
+    queues, with pHashes computed in hash_pool when one is given. Memory stays at roughly QUEUE_SIZE in-flight files, and results are
+    committed while downloads are still running, so a crash loses at most the
+    writes still in flight. Returns the writer stats and the files that failed to
+    process or write, as {fileUrl: (courseId, subcollection, paperDocId)}.
+    """
+    task_queue = queue.Queue(maxsize=QUEUE_SIZE)
+    result_queue = queue.Queue(maxsize=QUEUE_SIZE)
+    stop = threading.Event()
+    writer = DuplicateWriter(db)
     
-    # Commit any remaining operations
-    if file_hash_count > 0:
-        file_hashes_batch.commit()
-        
-    if duplicate_count > 0:
-        duplicates_batch.commit()
-        
-    return file_hash_count, duplicate_count
+    def enumerate_stage():
+        try:
+            for task in tasks:
+                if not _put(task_queue, task, stop):
+                    return
+        except Exception as e:
+            logger.error(f"Error enumerating papers: {e}")
+        finally:
+            for _ in range(MAX_WORKERS):
+                _put(task_queue, _DONE, stop)
+    
+    def process_stage():
+        while not stop.is_set():
+            try:
+                task = task_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            if task is _DONE:
+                break
+            url, course_id, sub, paper_doc_id, paper_data = task
+            result = process_file(url, course_id, sub, paper_doc_id, paper_data,
+                                  dedup_index, hash_cache, hash_pool)
+            if not _put(result_queue, result, stop):
+                return
+        _put(result_queue, _DONE, stop)
+    
+    threads = [threading.Thread(target=enumerate_stage, daemon=True)]
+    threads += [threading.Thread(target=process_stage, daemon=True) for _ in range(MAX_WORKERS)]
+    for thread in threads:
+        thread.start()
+    
+    # The writer runs on the calling thread so its errors propagate
+    try:
+        finished_workers = 0
+        while finished_workers < MAX_WORKERS:
+            try:
+                result = result_queue.get(timeout=FLUSH_INTERVAL)
+            except queue.Empty:
+                writer.flush()  # Nothing arriving: don't sit on a partial batch
+                continue
+            if result is _DONE:
+                finished_workers += 1
+            else:
+                writer.add(result)
+        writer.flush()
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=5)
+        writer.close()
+    return writer.stats, writer.failed_files
+
+def log_summary(stats):
+    logger.info("✅ Duplicate marking completed.")
+    logger.info(f"Files processed: {stats['processed']}")
+    logger.info(f"Served from hash cache: {stats['cached']}")
+    logger.info(f"File hashes stored: {stats['file_hashes']}")
+    logger.info(f"Duplicates found: {stats['duplicates']}")
+    logger.info(f"Errors: {stats['errors']}")
+    logger.info(f"Failed writes: {stats['write_errors']}")
 
 # ---- MAIN FUNCTION ---- #
+def iter_all_files(db):
+    """Yield a processing task for every file URL of every paper in every course"""
+    courses_ref = db.collection('courses')
+    
+    logger.info("Fetching courses...")
+    courses = list(courses_ref.stream())
+    logger.info(f"Found {len(courses)} courses")
+    
+    for course in courses:
+        course_id = course.id
+        logger.info(f"Processing course: {course_id}")
+        
+        for sub in SUBCOLLECTIONS:
+            sub_ref = courses_ref.document(course_id).collection(sub)
+            try:
+                papers = list(sub_ref.stream())
+                logger.info(f"  Found {len(papers)} papers in {sub}")
+            except Exception as e:
+                logger.error(f"Error fetching {sub} for course {course_id}: {e}")
+                continue
+            
+            for paper in papers:
+                paper_data = paper.to_dict()
+                for url in paper_data.get('fileUrls', []):
+                    yield url, course_id, sub, paper.id, paper_data
+
 def mark_duplicates():
     try:
         db = initialize_firebase()
-        courses_ref = db.collection('courses')
         
-        # Get all courses
-        logger.info("Fetching courses...")
-        courses = list(courses_ref.stream())
-        logger.info(f"Found {len(courses)} courses")
+        dedup_index = DedupIndex()
         
-        file_hash_map = {}      # For exact duplicates
-        image_hash_store = ImageHashStore()  # For perceptual duplicates
+        # Files hashed on earlier runs are looked up locally instead of re-downloaded
+        hash_cache = HashCache(HASH_CACHE_PATH)
+        if len(hash_cache) == 0:
+            seeded = hash_cache.seed_from_firestore(db)
+            logger.info(f"Seeded hash cache with {seeded} entries from fileHashes")
         
-        # Collect all files that need processing
-        processing_queue = []
+        with make_hash_pool() as hash_pool:
+            stats, _ = run_pipeline(db, iter_all_files(db), dedup_index, hash_cache, hash_pool)
+        hash_cache.close()
+        log_summary(stats)
         
-        for course in courses:
-            course_id = course.id
-            logger.info(f"Processing course: {course_id}")
-            
-            for sub in SUBCOLLECTIONS:
-                sub_ref = courses_ref.document(course_id).collection(sub)
-                try:
-                    papers = list(sub_ref.stream())
-                    logger.info(f"  Found {len(papers)} papers in {sub}")
-                    
-                    for paper in papers:
-                        paper_doc_id = paper.id
-                        paper_data = paper.to_dict()
-                        file_urls = paper_data.get('fileUrls', [])
-                        
-                        for url in file_urls:
-                            processing_queue.append((url, course_id, sub, paper_doc_id, paper_data))
-                            
-                except Exception as e:
-                    logger.error(f"Error fetching {sub} for course {course_id}: {e}")
+    except Exception as e:
+        logger.error(f"Fatal error in mark_duplicates: {e}")
+        raise
+
+# ---- INCREMENTAL MODE ---- #
+def load_watermark():
+    try:
+        with open(WATERMARK_FILE, "r") as f:
+            value = f.read().strip()
+        return datetime.fromisoformat(value) if value else None
+    except FileNotFoundError:
+        return None
+
+def save_watermark(value):
+    with open(WATERMARK_FILE, "w") as f:
+        f.write(value.isoformat())
+
+def paper_timestamps(paper_data):
+    """The watermark field values a paper carries (uploadedAt, createdAt or both)"""
+    return [paper_data[field] for field in WATERMARK_FIELDS if paper_data.get(field)]
+
+def load_retries():
+    """{fileUrl: {"courseId", "subcollection", "paperDocId", "attempts"}} left by earlier runs"""
+    try:
+        with open(RETRY_FILE, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_retries(retries):
+    # Write then rename, so a crash mid-write never leaves a corrupt retry file
+    tmp_file = RETRY_FILE + ".tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(retries, f, indent=2)
+    os.replace(tmp_file, RETRY_FILE)
+
+def fetch_retry_papers(db, retries):
+    """Yield (course_id, subcollection, paper) for the still existing papers of the files to retry"""
+    refs = {
+        (entry["courseId"], entry["subcollection"], entry["paperDocId"]):
+            db.collection('courses').document(entry["courseId"]).collection(entry["subcollection"]).document(entry["paperDocId"])
+        for entry in retries.values()
+    }
+    if not refs:
+        return
+    for paper in db.get_all(list(refs.values())):
+        if paper.exists:
+            yield paper.reference.parent.parent.id, paper.reference.parent.id, paper
+
+def next_retries(retries, failed_files):
+    """
+    Retry entries for the files that failed in this run. Files that failed in
+    MAX_RETRY_RUNS runs are dropped, so a permanently broken URL (e.g. a deleted
+    upload returning 404) cannot hold up later runs.
+    """
+    updated = {}
+    for url, (course_id, sub, paper_doc_id) in failed_files.items():
+        attempts = retries.get(url, {}).get("attempts", 0) + 1
+        if attempts >= MAX_RETRY_RUNS:
+            logger.error(f"Giving up on {url} after {attempts} failed runs")
+            continue
+        updated[url] = {"courseId": course_id, "subcollection": sub, "paperDocId": paper_doc_id, "attempts": attempts}
+    return updated
+
+def fetch_new_papers(db, since):
+    """
+    Yield (course_id, subcollection, paper) for every paper uploaded after `since`,
+    using one collection-group query per subcollection and watermark field instead of
+    walking every course. A query on a field never returns documents lacking it, so
+    each field gets its own query and the results are merged by paper path.
+    Placeholder docs carry neither field and never match.
+    """
+    seen = set()
+    for sub in SUBCOLLECTIONS:
+        for field in WATERMARK_FIELDS:
+            query = db.collection_group(sub)
+            if since:
+                query = query.where(filter=FieldFilter(field, ">", since))
+            for paper in query.order_by(field).stream():
+                if paper.reference.path in seen:
+                    continue
+                seen.add(paper.reference.path)
+                yield paper.reference.parent.parent.id, sub, paper
+
+def find_recorded_urls(db, urls):
+    """Return the subset of urls that already have a fileHashes document"""
+    urls = list(urls)
+    recorded = set()
+    for i in range(0, len(urls), 30):  # Firestore 'in' filters take at most 30 values
+        query = db.collection('fileHashes').where(filter=FieldFilter('fileUrl', 'in', urls[i:i + 30]))
+        docs = query.select(['fileUrl']).stream()
+        recorded.update(doc.to_dict().get('fileUrl') for doc in docs)
+    return recorded
+
+def mark_new_duplicates():
+    """
+    Incremental variant of mark_duplicates: only papers uploaded after the stored
+    watermark are processed, compared against the local hash index, and only files
+    without an existing fileHashes document are written. Files that failed in earlier
+    runs are retried from RETRY_FILE.
+    """
+    try:
+        db = initialize_firebase()
+        hash_cache = HashCache(HASH_CACHE_PATH)
+        if len(hash_cache) == 0:
+            seeded = hash_cache.seed_from_firestore(db)
+            logger.info(f"Seeded hash cache with {seeded} entries from fileHashes")
         
-        logger.info(f"Total files to process: {len(processing_queue)}")
+        watermark = load_watermark()
+        logger.info(f"Fetching papers uploaded after {watermark.isoformat() if watermark else 'the beginning'}...")
         
-        # Process files in parallel
-        results = []
-        with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            future_to_url = {
-                executor.submit(
-                    process_file, url, course_id, sub, paper_doc_id, paper_data, 
-                    file_hash_map, image_hash_store
-                ): url 
-                for url, course_id, sub, paper_doc_id, paper_data in processing_queue
-            }
-            
-            for future in concurrent.futures.as_completed(future_to_url):
-                url = future_to_url[future]
-                try:
-                    result = future.result()
-                    results.append(result)
-                except Exception as e:
-                    logger.error(f"Exception processing {url}: {e}")
-                    results.append({
-                        "fileUrl": url,
-                        "error": str(e)
-                    })
-                    
-        # Batch write results to Firebase
-        logger.info("Writing results to Firestore...")
-        file_hash_count, duplicate_count = write_batched_documents(db, results)
+        new_papers = []
+        new_watermark = watermark
+        for course_id, sub, paper in fetch_new_papers(db, watermark):
+            paper_data = paper.to_dict()
+            new_papers.append((course_id, sub, paper.id, paper_data))
+            # Both fields are queried against the watermark, so it advances to the max over both
+            for uploaded_at in paper_timestamps(paper_data):
+                if new_watermark is None or uploaded_at > new_watermark:
+                    new_watermark = uploaded_at
+        logger.info(f"Found {len(new_papers)} new papers")
         
-        # Summary
-        error_count = sum(1 for r in results if "error" in r)
-        logger.info("✅ Duplicate marking completed.")
-        logger.info(f"Files processed: {len(results)}")
-        logger.info(f"File hashes stored: {file_hash_count}")
-        logger.info(f"Duplicates found: {duplicate_count}")
-        logger.info(f"Errors: {error_count}")
+        retries = load_retries()
+        if retries:
+            queued_papers = {(course_id, sub, paper_doc_id) for course_id, sub, paper_doc_id, _ in new_papers}
+            for course_id, sub, paper in fetch_retry_papers(db, retries):
+                if (course_id, sub, paper.id) not in queued_papers:
+                    new_papers.append((course_id, sub, paper.id, paper.to_dict()))
+            logger.info(f"Retrying {len(retries)} files that failed in earlier runs")
+        
+        candidate_urls = {url for _, _, _, paper_data in new_papers for url in paper_data.get('fileUrls', [])}
+        recorded_urls = find_recorded_urls(db, candidate_urls)
+        processing_queue = [
+            (url, course_id, sub, paper_doc_id, paper_data)
+            for course_id, sub, paper_doc_id, paper_data in new_papers
+            for url in paper_data.get('fileUrls', [])
+            if url not in recorded_urls
+        ]
+        logger.info(f"Total new files to process: {len(processing_queue)} ({len(recorded_urls)} already recorded)")
+        
+        # Compare against everything hashed before, minus the files being (re)processed now
+        dedup_index = hash_cache.build_index(exclude_urls={url for url, *_ in processing_queue})
+        with make_hash_pool() as hash_pool:
+            stats, failed_files = run_pipeline(db, processing_queue, dedup_index, hash_cache, hash_pool)
+        hash_cache.close()
+        
+        # Files that failed to download, hash or write are recorded for the next runs
+        # before the watermark moves past them; the rest of the delta is written
+        save_retries(next_retries(retries, failed_files))
+        if failed_files:
+            logger.warning(f"{len(failed_files)} files failed and will be retried from {RETRY_FILE}")
+        if new_watermark:
+            save_watermark(new_watermark)
+            logger.info(f"Watermark advanced to {new_watermark.isoformat()}")
+        log_summary(stats)
         
     except Exception as e:
-        logger.error(f"Fatal error in mark_duplicates: {e}")
+        logger.error(f"Fatal error in mark_new_duplicates: {e}")
         raise
 
 # ---- RUN ---- #
 if __name__ == "__main__":
-    mark_duplicates()
\ No newline at end of file
+    if "--incremental" in sys.argv:
+        mark_new_duplicates()
+    else:
+        mark_duplicates()
\ No newline at end of file
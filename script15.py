@@ -1,6 +1,7 @@
 import firebase_admin
 from firebase_admin import credentials, firestore
 import random
+from write_engine import WriteEngine, describe_failure
 
 # Initialize Firebase
 cred = credentials.Certificate('campusaid-afe4b-firebase-adminsdk-i2di4-4484b29e45.json')  # Path to your service account key
@@ -15,9 +16,7 @@ def add_unique_display_usernames():
         docs = users_ref.stream()
         
         used_display_names = set()
-        batch = db.batch()
-        batch_count = 0
-        max_batch_size = 500  # Firestore batch limit
+        engine = WriteEngine(db)
         
         for doc in docs:
             user_data = doc.to_dict()
@@ -48,22 +47,14 @@ def add_unique_display_usernames():
             
             # Update the document
             user_ref = users_ref.document(doc.id)
-            batch.update(user_ref, {'displayUserName': display_name})
-            batch_count += 1
-            
-            # Commit batch if we reach batch size limit
-            if batch_count >= max_batch_size:
-                batch.commit()
-                print(f"Committed batch of {batch_count} updates")
-                batch = db.batch()
-                batch_count = 0
+            engine.update(user_ref, {'displayUserName': display_name})
         
-        # Commit any remaining updates in the batch
-        if batch_count > 0:
-            batch.commit()
-            print(f"Committed final batch of {batch_count} updates")
+        # Wait for every queued update
+        failures = engine.close()
+        for failure in failures:
+            print(f"Failed to update {describe_failure(failure)}")
         
-        print("Successfully added display usernames to all users!")
+        print(f"Successfully added display usernames to {engine.written} users!")
     
     except Exception as e:
         print(f"Error adding display usernames: {e}")
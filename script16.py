@@ -1,12 +1,28 @@
+import concurrent.futures
+import sys
 import firebase_admin
 from firebase_admin import credentials, firestore
 from tenacity import retry, stop_after_attempt, wait_exponential
+from change_writer import ChangeWriter
+from checkpoint import CheckpointedQuery
+from course_counts import (
+    COUNTER_FIELDS, SUB_COLLECTIONS, count_papers, read_course_counters, scan_paper_counts
+)
+from firestore_emulator import emulator_client
+from write_engine import describe_failure
 
 firebase_app = None  # Global Firebase app instance
 
+MAX_WORKERS = 16   # Count queries in flight at once
+BATCH_SIZE = 400   # Courses counted and written per checkpointed page
+CHECKPOINT_FILE = "script16_checkpoint.json"
+
 def initialize_firebase(credentials_path):
     """Initializes Firebase only once."""
     global firebase_app
+    emulator_db = emulator_client()
+    if emulator_db is not None:
+        return emulator_db
     if not firebase_admin._apps:  # Prevent multiple initializations
         try:
             cred = credentials.Certificate(credentials_path)
@@ -16,94 +32,134 @@ def initialize_firebase(credentials_path):
             return None
     return firestore.client()
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
-def get_course_documents(courses_ref):
-    """Fetches course documents with retry logic."""
-    return list(courses_ref.list_documents())  # Uses list_documents() instead of stream()
+def count_courses(executor, courses):
+    """
+    Counts the papers of a list of course snapshots, every (course, sub-collection) at once.
+    Returns ([(course_snapshot, update_data), ...], failed course IDs).
+    """
+    counters = {course.id: {} for course in courses}
+    failed = set()
+    updates = []
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
-def get_sub_collection_documents(sub_collection_ref):
-    """Fetches sub-collection documents with retry logic."""
-    return list(sub_collection_ref.stream())  # Materializes the stream
+    futures = {
+        executor.submit(count_papers, course.reference.collection(sub_collection)): (course, sub_collection)
+        for course in courses
+        for sub_collection in SUB_COLLECTIONS
+    }
+    for future in concurrent.futures.as_completed(futures):
+        course, sub_collection = futures[future]
+        course_id = course.id
+        try:
+            # Server-side count(), placeholder doc excluded
+            counters[course_id][SUB_COLLECTIONS[sub_collection]] = future.result()
+        except Exception as e:
+            print(f"Error processing {sub_collection} for {course_id}: {e}")
+            failed.add(course_id)
+            counters[course_id][SUB_COLLECTIONS[sub_collection]] = None
+
+        if len(counters[course_id]) < len(SUB_COLLECTIONS):
+            continue  # Other sub-collections of this course are still being counted
+        if course_id in failed:
+            # A partial count would overwrite a correct total with a wrong one
+            print(f"Skipping {course_id}: not every sub-collection could be counted")
+            continue
 
-def update_course_totals(db):
-    """Updates total_papers, mid_sem_papers, end_sem_papers, and quiz_papers for all courses."""
+        update_data = dict(counters[course_id])
+        update_data["total_papers"] = sum(update_data.values())
+        updates.append((course, update_data))
+        print(f"Counted {course_id}:")
+        print(f"  Total papers: {update_data['total_papers']}")
+        print(f"  Mid-semester papers: {update_data['mid_sem_papers']}")
+        print(f"  End-semester papers: {update_data['end_sem_papers']}")
+        print(f"  Quiz papers: {update_data['quiz_papers']}")
+        print("-" * 40)
+
+    return updates, failed
+
+def update_course_totals(db, max_workers=MAX_WORKERS, engine="count"):
+    """
+    Updates total_papers, mid_sem_papers, end_sem_papers, and quiz_papers for all courses.
+    Courses are processed a page of BATCH_SIZE at a time: every (course, sub-collection) count
+    of the page runs concurrently on a bounded thread pool, then the changed counters are flushed
+    and checkpointed, so a stopped run resumes at the first unfinished page.
+    engine="scan" uses update_course_totals_from_scan instead.
+    """
     if not db:
         return
-    
-    courses_ref = db.collection("courses")
-    
+    if engine == "scan":
+        return update_course_totals_from_scan(db)
+
+    # Only the stored counters are read, so unchanged courses can be skipped without a get()
+    courses_query = db.collection("courses").select(COUNTER_FIELDS)
+    courses = CheckpointedQuery(courses_query, CHECKPOINT_FILE, page_size=BATCH_SIZE)
+    if courses.resumed:
+        print(f"Resuming after {courses.last_id} ({courses.processed} courses already processed)")
+    writer = ChangeWriter(db)
+
     try:
-        courses = get_course_documents(courses_ref)  # Uses retry-wrapped function
-        
-        for course in courses:
-            course_id = course.id
-            
-            # Initialize counters
-            mid_sem_papers = 0
-            end_sem_papers = 0
-            quiz_papers = 0
-            total_papers = 0
-            
-            # Get existing document data
-            course_doc = course.get()
-            if not course_doc.exists:
-                print(f"Warning: Course {course_id} document doesn't exist")
-                continue
-            
-            # Count papers in each sub-collection
-            sub_collections = {
-                "mid-semester": "mid_sem_papers",
-                "end-semester": "end_sem_papers", 
-                "quizzes": "quiz_papers"
-            }
-            
-            counters = {
-                "mid_sem_papers": 0,
-                "end_sem_papers": 0,
-                "quiz_papers": 0
-            }
-            
-            for sub_collection, counter_field in sub_collections.items():
-                try:
-                    sub_collection_ref = course.collection(sub_collection)
-                    papers = get_sub_collection_documents(sub_collection_ref)  # Uses retry-wrapped function
-                    
-                    # Exclude placeholder doc
-                    real_papers = [doc for doc in papers if doc.id != "placeholder"]
-                    paper_count = len(real_papers)
-                    
-                    counters[counter_field] = paper_count
-                    total_papers += paper_count
-                    
-                except Exception as e:
-                    print(f"Error processing {sub_collection} for {course_id}: {e}")
-                    continue
-            
-            try:
-                # Update course document with all paper counts
-                update_data = {
-                    "total_papers": total_papers,
-                    "mid_sem_papers": counters["mid_sem_papers"],
-                    "end_sem_papers": counters["end_sem_papers"],
-                    "quiz_papers": counters["quiz_papers"]
-                }
-                
-                course.update(update_data)
-                print(f"Updated {course_id}:")
-                print(f"  Total papers: {total_papers}")
-                print(f"  Mid-semester papers: {counters['mid_sem_papers']}")
-                print(f"  End-semester papers: {counters['end_sem_papers']}")
-                print(f"  Quiz papers: {counters['quiz_papers']}")
-                print("-" * 40)
-                
-            except Exception as e:
-                print(f"Failed to update {course_id}: {e}")
-                
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for page in courses.pages():
+                updates, failed = count_courses(executor, page)
+                for course, update_data in updates:
+                    writer.update(course.reference, course.to_dict(), update_data)
+                writer.flush()
+                if failed:
+                    # Keep the checkpoint before this page so the next run redoes it
+                    print(f"Stopped after {courses.processed} courses; run again to resume")
+                    return
+                courses.commit(page[-1], count=len(page))
+                print(f"Processed {courses.processed} courses so far ({writer.summary()})")
     except Exception as e:
-        print(f"Failed to stream courses: {e}")
+        print(f"Failed to update courses: {e}")
+        print(f"Stopped after {courses.processed} courses; run again to resume")
+        return
+    finally:
+        for failure in writer.close():
+            print(f"Failed to update {describe_failure(failure)}")
+
+    print(f"Processed all {courses.processed} courses: {writer.summary()}")
+    courses.finish()
+
+@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
+def get_scanned_counts(db):
+    """Collection-group paper counts with retry logic."""
+    return scan_paper_counts(db)
+
+def update_course_totals_from_scan(db):
+    """
+    Alternative engine: counts every course's papers in three collection_group streams
+    and writes only the courses whose stored counters differ from the scan.
+    Far fewer round trips than per-course count() queries, but every paper is a billed read.
+    """
+    try:
+        courses = read_course_counters(db)
+        scanned = get_scanned_counts(db)
+    except Exception as e:
+        print(f"Failed to scan papers: {e}")
+        return
+
+    writer = ChangeWriter(db)
+    try:
+        for course_id, (course, stored) in courses.items():
+            update_data = dict(scanned.get(course_id) or dict.fromkeys(SUB_COLLECTIONS.values(), 0))
+            update_data["total_papers"] = sum(update_data.values())
+            if writer.update(course, stored, update_data):
+                print(f"{course_id}: {stored['total_papers']} -> {update_data['total_papers']} papers")
+        writer.flush()
+    except Exception as e:
+        print(f"Failed to update courses: {e}")
+    finally:
+        for failure in writer.close():
+            print(f"Failed to update {describe_failure(failure)}")
+
+    orphaned = set(scanned) - set(courses)
+    if orphaned:
+        print(f"Warning: papers found under {len(orphaned)} missing course docs: {sorted(orphaned)}")
+
+    print(f"Courses {writer.summary()}")
 
 if __name__ == "__main__":
     db = initialize_firebase("campusaid-afe4b-firebase-adminsdk-i2di4-4484b29e45.json")
     if db:
-        update_course_totals(db)
\ No newline at end of file
+        # Optional: python script16.py --scan
+        update_course_totals(db, engine="scan" if "--scan" in sys.argv else "count")
\ No newline at end of file
@@ -1,9 +1,14 @@
 import firebase_admin
 from firebase_admin import credentials, firestore
-from firebase_admin import exceptions as firebase_exceptions
+from google.api_core import exceptions as google_exceptions
+import concurrent.futures
 import logging
+from collections import defaultdict
 from datetime import datetime, timezone
+import sqlite3
+import threading
 import time
+from write_engine import WriteEngine, describe_failure
 
 # Set up logging
 logging.basicConfig(
@@ -31,111 +36,347 @@ def initialize_firebase():
         logger.error(f"Failed to initialize Firebase: {e}")
         raise
 
-current_time = datetime.now(timezone.utc).isoformat()  # This includes the "+00:00" UTC offset
-timestamp_filename = "pitr_restore_point.txt"
+# ---- SETTINGS ---- #
+MAX_WORKERS = 8            # Papers updated in parallel
+BATCH_SIZE = 400           # Duplicate entries deleted between journal updates
+MAX_RETRIES = 5            # Attempts per paper when Firestore pushes back
+INITIAL_RATE = 20.0        # Paper transactions per second to start with
+MAX_RATE = 500.0           # Upper bound for the adaptive rate
+JOURNAL_PATH = "deletion_journal.db"          # Progress of the current run, survives crashes
+RESTORE_POINT_FILE = "pitr_restore_point.txt"
 
-with open(timestamp_filename, "w") as f:
-    f.write(f"Firestore restore point before deletion: {current_time}\n")
+# Errors that mean "slow down" rather than "this entry is broken"
+THROTTLE_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.Aborted,
+)
+
+# ---- RESTORE POINT ---- #
+def write_restore_point():
+    """Record the PITR timestamp to restore to if this run has to be undone"""
+    current_time = datetime.now(timezone.utc).isoformat()  # This includes the "+00:00" UTC offset
+    with open(RESTORE_POINT_FILE, "w") as f:
+        f.write(f"Firestore restore point before deletion: {current_time}\n")
+    logger.info(f"🕒 Restore point written to {RESTORE_POINT_FILE}: {current_time}")
+    return current_time
+
+# ---- WRITE-AHEAD JOURNAL ---- #
+# Entry states: pending -> removing -> url_removed -> entry_deleted, or skipped.
+# 'removing' is written before a paper's transaction runs, so after a crash only
+# papers that were in flight are retried; everything else resumes where it stopped.
+PENDING, REMOVING, URL_REMOVED, ENTRY_DELETED, SKIPPED = (
+    "pending", "removing", "url_removed", "entry_deleted", "skipped"
+)
+
+class DeletionJournal:
+    """SQLite journal of every duplicate entry in the current run and its state"""
+    def __init__(self, path=JOURNAL_PATH):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "duplicate_id TEXT PRIMARY KEY, course_id TEXT, subcollection TEXT, "
+            "paper_doc_id TEXT, url TEXT, state TEXT NOT NULL)"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.commit()
+
+    def has_unfinished(self):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT COUNT(*) FROM entries WHERE state NOT IN (?, ?)", (ENTRY_DELETED, SKIPPED)
+            ).fetchone()
+        return row[0] > 0
+
+    def start(self, groups, restore_point):
+        """Replace the journal with a new run over the grouped duplicate entries"""
+        rows = [
+            (duplicate_id, course_id, subcollection, paper_doc_id, url, PENDING)
+            for (course_id, subcollection, paper_doc_id), entries in groups.items()
+            for duplicate_id, url in entries
+        ]
+        with self.lock:
+            self.conn.execute("DELETE FROM entries")
+            self.conn.executemany("INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('restore_point', ?)", (restore_point,))
+            self.conn.commit()
+
+    def restore_point(self):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'restore_point'").fetchone()
+        return row[0] if row else None
+
+    def groups_to_process(self):
+        """{paper_key: [(duplicate_id, url, state), ...]} for entries whose URL is not removed yet"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT course_id, subcollection, paper_doc_id, duplicate_id, url, state "
+                "FROM entries WHERE state IN (?, ?)", (PENDING, REMOVING)
+            ).fetchall()
+        groups = defaultdict(list)
+        for course_id, subcollection, paper_doc_id, duplicate_id, url, state in rows:
+            groups[(course_id, subcollection, paper_doc_id)].append((duplicate_id, url, state))
+        return groups
+
+    def awaiting_deletion(self):
+        """Entries whose URL is gone but whose 'duplicates' doc still exists"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT duplicate_id FROM entries WHERE state = ?", (URL_REMOVED,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def mark(self, duplicate_ids, state):
+        with self.lock:
+            self.conn.executemany(
+                "UPDATE entries SET state = ? WHERE duplicate_id = ?",
+                [(state, duplicate_id) for duplicate_id in duplicate_ids]
+            )
+            self.conn.commit()
+
+    def counts(self):
+        with self.lock:
+            return dict(self.conn.execute("SELECT state, COUNT(*) FROM entries GROUP BY state").fetchall())
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+# ---- ADAPTIVE RATE CONTROL ---- #
+class AdaptiveRateLimiter:
+    """
+    Additive-increase / multiplicative-decrease limiter shared by all workers.
+    Every success nudges the rate up, every throttling error halves it, so the
+    run settles just below what Firestore accepts instead of sleeping a fixed time.
+    """
+    def __init__(self, rate=INITIAL_RATE, max_rate=MAX_RATE, min_rate=1.0):
+        self.rate = rate
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_slot - now
+            self.next_slot = max(self.next_slot, now) + 1.0 / self.rate
+        if wait > 0:
+            time.sleep(wait)
+
+    def on_success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + 1.0)
+
+    def on_throttle(self):
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            logger.warning(f"Firestore is throttling, rate lowered to {self.rate:.1f}/s")
+
+# ---- GROUPING ---- #
+def group_duplicates_by_paper(duplicates_ref):
+    """
+    Stream the 'duplicates' collection and group entries by the paper they point at.
+    Returns ({(course_id, subcollection, paper_doc_id): [(duplicate_id, url), ...]}, skipped_count).
+    """
+    groups = defaultdict(list)
+    skipped_count = 0
+    for doc in duplicates_ref.stream():
+        duplicate_entry = doc.to_dict()
+        duplicate_file_url = duplicate_entry.get('duplicateFileUrl')
+        course_id = duplicate_entry.get('courseId')
+        subcollection = duplicate_entry.get('subcollection')
+        paper_doc_id = duplicate_entry.get('paperDocId')
+
+        if not all([duplicate_file_url, course_id, subcollection, paper_doc_id]):
+            logger.warning(f"Skipping duplicate entry {doc.id} due to missing required fields: {duplicate_entry}")
+            skipped_count += 1
+            continue
+
+        groups[(course_id, subcollection, paper_doc_id)].append((doc.id, duplicate_file_url))
+    return groups, skipped_count
+
+# ---- PER-PAPER REMOVAL ---- #
+@firestore.transactional
+def remove_urls_from_paper(transaction, doc_ref, urls_to_remove):
+    """Remove every listed URL from one paper in a single update; returns the URLs actually removed"""
+    snapshot = doc_ref.get(transaction=transaction)
+    if not snapshot.exists:
+        return None
+
+    current_file_urls = snapshot.to_dict().get('fileUrls')
+    if current_file_urls is None:
+        return []
 
-logger.info(f"🕒 Restore point written to {timestamp_filename}: {current_time}")
+    present = [url for url in urls_to_remove if url in current_file_urls]
+    if present:
+        transaction.update(doc_ref, {'fileUrls': firestore.ArrayRemove(present)})
+    return present
+
+def process_paper_group(db, limiter, journal, paper_key, entries):
+    """
+    Remove all duplicate URLs of one paper. Returns (removed_ids, skipped_ids).
+    Entries whose URL was already gone are skipped and left in 'duplicates', as before,
+    except for entries journaled as 'removing': their transaction may have committed
+    right before a crash, so a missing URL counts as removed.
+    """
+    course_id, subcollection, paper_doc_id = paper_key
+    path = f"{course_id}/{subcollection}/{paper_doc_id}"
+    paper_doc_ref = db.collection('courses').document(course_id).collection(subcollection).document(paper_doc_id)
+    urls = list(dict.fromkeys(url for _, url, _ in entries))
+    in_flight_urls = {url for _, url, state in entries if state == REMOVING}
+    all_ids = [duplicate_id for duplicate_id, _, _ in entries]
+
+    # Write-ahead: record the intent before touching the paper
+    journal.mark(all_ids, REMOVING)
+
+    for attempt in range(MAX_RETRIES):
+        limiter.acquire()
+        try:
+            removed = remove_urls_from_paper(db.transaction(), paper_doc_ref, urls)
+            limiter.on_success()
+            break
+        except THROTTLE_ERRORS as e:
+            limiter.on_throttle()
+            if attempt == MAX_RETRIES - 1:
+                # Leave the entries in 'removing' so the next run retries this paper
+                logger.error(f"Giving up on {path} after {MAX_RETRIES} attempts: {e}")
+                return [], []
+
+    if removed is None:
+        logger.warning(f"Paper document {path} not found for {len(urls)} duplicate URL(s). Skipping.")
+        return [], all_ids
+
+    removed = set(removed)
+    if removed:
+        logger.info(f"✓ Removed {len(removed)} URL(s) from {path}")
+    else:
+        logger.info(f"No duplicate URLs left in 'fileUrls' for {path}. Already removed or never existed.")
+    removed_ids = []
+    skipped_ids = []
+    for duplicate_id, url, _ in entries:
+        if url in removed or url in in_flight_urls:
+            removed_ids.append(duplicate_id)
+        else:
+            skipped_ids.append(duplicate_id)
+    return removed_ids, skipped_ids
+
+# ---- BATCHED ENTRY DELETION ---- #
+class DuplicateEntryDeleter:
+    """Deletes processed 'duplicates' docs through the shared WriteEngine, journaling them BATCH_SIZE at a time"""
+    def __init__(self, db, journal):
+        self.db = db
+        self.journal = journal
+        self.engine = WriteEngine(db)
+        self.pending = []
+        self.deleted_count = 0
+
+    def add(self, duplicate_ids):
+        for duplicate_id in duplicate_ids:
+            self.engine.delete(self.db.collection('duplicates').document(duplicate_id))
+        self.pending.extend(duplicate_ids)
+        if len(self.pending) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        ids, self.pending = self.pending, []
+        if not ids:
+            return []
+        failures = self.engine.flush()
+        for failure in failures:
+            logger.warning(f"Failed to delete duplicate entry {describe_failure(failure)}")
+        # Failed entries stay 'url_removed' in the journal and are retried by the next run
+        failed_ids = {failure.operation.reference.id for failure in failures}
+        deleted_ids = [duplicate_id for duplicate_id in ids if duplicate_id not in failed_ids]
+        self.journal.mark(deleted_ids, ENTRY_DELETED)
+        self.deleted_count += len(deleted_ids)
+        logger.info(f"🗑️ Deleted {len(deleted_ids)} duplicate entries ({self.deleted_count} so far)")
+        return failures
+
+    def close(self):
+        """Flush, then shut the WriteEngine down; returns the failures"""
+        return self.flush() + self.engine.close()
 
 # ---- MAIN DELETION FUNCTION ---- #
 def remove_duplicate_urls_from_papers():
     """
-    Iterates through the 'duplicates' collection and removes the 'duplicateFileUrl'
-    from the 'fileUrls' array of the corresponding paper document in Firestore.
+    Removes every 'duplicateFileUrl' listed in the 'duplicates' collection from the
+    'fileUrls' array of its paper. Entries are grouped per paper so each paper gets
+    one ArrayRemove, papers are processed in parallel under adaptive rate control,
+    and the processed 'duplicates' docs are deleted in batches.
+    Progress is journaled in JOURNAL_PATH; an interrupted run picks up where it
+    stopped without repeating finished transactions.
     """
-    db = None
+    journal = None
+    deleter = None
     try:
         db = initialize_firebase()
-        
-        duplicates_ref = db.collection('duplicates')
-        
-        logger.info("Fetching duplicate entries from 'duplicates' collection...")
-        
+        journal = DeletionJournal(JOURNAL_PATH)
+
+        if journal.has_unfinished():
+            logger.info(f"Resuming unfinished run (restore point {journal.restore_point()})")
+        else:
+            restore_point = write_restore_point()
+            logger.info("Fetching duplicate entries from 'duplicates' collection...")
+            groups, skipped_count = group_duplicates_by_paper(db.collection('duplicates'))
+            if skipped_count:
+                logger.info(f"Skipped {skipped_count} entries with missing fields")
+            journal.start(groups, restore_point)
+
+        groups = journal.groups_to_process()
+        total_entries = sum(len(entries) for entries in groups.values())
+        logger.info(f"{total_entries} duplicate entries across {len(groups)} papers left to process")
+
+        limiter = AdaptiveRateLimiter()
         processed_count = 0
-        deleted_url_count = 0
-        skipped_count = 0
-        
-        # Stream duplicates in batches to handle large collections
-        duplicates_stream = duplicates_ref.stream()
-        
-        for doc in duplicates_stream:
-            duplicate_entry = doc.to_dict()
-            duplicate_id = doc.id
-            
-            duplicate_file_url = duplicate_entry.get('duplicateFileUrl')
-            course_id = duplicate_entry.get('courseId')
-            subcollection = duplicate_entry.get('subcollection')
-            paper_doc_id = duplicate_entry.get('paperDocId')
-            
-            if not all([duplicate_file_url, course_id, subcollection, paper_doc_id]):
-                logger.warning(f"Skipping duplicate entry {duplicate_id} due to missing required fields: {duplicate_entry}")
-                skipped_count += 1
-                continue
-            
-            paper_doc_ref = db.collection('courses').document(course_id).collection(subcollection).document(paper_doc_id)
-            
-            try:
-                # Use a transaction for safer updates
-                @firestore.transactional
-                def update_paper_document(transaction, doc_ref, url_to_remove):
-                    snapshot = doc_ref.get(transaction=transaction)
-                    if not snapshot.exists:
-                        logger.warning(f"Paper document {paper_doc_id} in {course_id}/{subcollection} not found for duplicate URL {url_to_remove}. Skipping.")
-                        return False # Indicate that update didn't happen for this reason
-                    
-                    current_file_urls = snapshot.get('fileUrls')
-                    if current_file_urls is None:
-                        logger.warning(f"Paper document {paper_doc_id} in {course_id}/{subcollection} has no 'fileUrls' field. Skipping removal of {url_to_remove}.")
-                        return False
-
-                    if url_to_remove in current_file_urls:
-                        # Use ArrayRemove to remove the specific URL
-                        transaction.update(doc_ref, {'fileUrls': firestore.ArrayRemove([url_to_remove])})
-                        logger.info(f"✓ Removed '{url_to_remove}' from {course_id}/{subcollection}/{paper_doc_id}")
-                        return True # Indicate successful removal
-                    else:
-                        logger.info(f"'{url_to_remove}' not found in 'fileUrls' for {course_id}/{subcollection}/{paper_doc_id}. Already removed or never existed.")
-                        return False # Indicate URL was not found for removal
-
-                # Attempt the transaction
-                if update_paper_document(db.transaction(), paper_doc_ref, duplicate_file_url):
-                    deleted_url_count += 1
-
-                    try:
-                        duplicates_ref.document(duplicate_id).delete()
-                        logger.info(f"🗑️ Deleted duplicate entry {duplicate_id}")
-
-                        # ✅ Log the deleted duplicate ID to a file
-                        with open("removed_duplicates.txt", "a") as f:
-                          f.write(f"{duplicate_id}\n")
-
-                    except Exception as e:
-                        logger.warning(f"Failed to delete duplicate entry {duplicate_id}: {e}")
-                
-                processed_count += 1
-                if processed_count % 100 == 0:
+        next_report = 100
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            deleter = DuplicateEntryDeleter(db, journal)
+            # URLs removed before an interruption only need their entries deleted
+            deleter.add(journal.awaiting_deletion())
+
+            futures = {
+                executor.submit(process_paper_group, db, limiter, journal, paper_key, entries): (paper_key, entries)
+                for paper_key, entries in groups.items()
+            }
+            for future in concurrent.futures.as_completed(futures):
+                paper_key, entries = futures[future]
+                try:
+                    removed_ids, skipped_ids = future.result()
+                except Exception as e:
+                    logger.error(f"Error processing paper {'/'.join(paper_key)}: {e}")
+                    removed_ids, skipped_ids = [], []
+
+                journal.mark(removed_ids, URL_REMOVED)
+                journal.mark(skipped_ids, SKIPPED)
+                deleter.add(removed_ids)
+
+                processed_count += len(entries)
+                if processed_count >= next_report:
                     logger.info(f"Processed {processed_count} duplicate entries so far...")
+                    next_report += 100
+            deleter.flush()
 
-            except firebase_exceptions.NotFound:
-                logger.warning(f"Paper document {paper_doc_id} in {course_id}/{subcollection} not found for duplicate URL {duplicate_file_url}. It might have been deleted.")
-                skipped_count += 1
-            except Exception as e:
-                logger.error(f"Error processing duplicate entry {duplicate_id} (URL: {duplicate_file_url}): {e}")
-                skipped_count += 1
-            
-            # Small delay to avoid hitting rate limits if processing many documents
-            time.sleep(0.05) 
-            
+        counts = journal.counts()
         logger.info("\n--- Duplicate URL Removal Summary ---")
-        logger.info(f"Total duplicate entries processed: {processed_count}")
-        logger.info(f"Successfully removed URLs from paper documents: {deleted_url_count}")
-        logger.info(f"Entries skipped (e.g., missing data, paper doc not found, URL already removed): {skipped_count}")
+        logger.info(f"Duplicate entries processed this run: {processed_count}")
+        logger.info(f"Duplicate entries deleted this run: {deleter.deleted_count}")
+        logger.info(f"Journal: {counts.get(ENTRY_DELETED, 0)} deleted, {counts.get(SKIPPED, 0)} skipped "
+                    f"(paper doc not found or URL already removed), "
+                    f"{counts.get(PENDING, 0) + counts.get(REMOVING, 0) + counts.get(URL_REMOVED, 0)} unfinished")
         logger.info("Process complete.")
 
     except Exception as e:
         logger.critical(f"Fatal error during duplicate URL removal: {e}")
+    finally:
+        if deleter:
+            deleter.close()
+        if journal:
+            journal.close()
 
 # ---- RUN ---- #
 if __name__ == "__main__":
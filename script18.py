@@ -1,7 +1,7 @@
 import firebase_admin
 from firebase_admin import credentials, firestore
 import logging
-import time
+from write_engine import WriteEngine, describe_failure
 
 # --- Logging Setup ---
 logging.basicConfig(
@@ -38,7 +38,7 @@ COLLECTIONS_TO_TRANSFER = {
     'courses': ['end-semester', 'mid-semester', 'quizzes'] # List of subcollections for 'courses'
 }
 
-BATCH_SIZE = 400 # Max 500 for Firestore batch writes
+PROGRESS_INTERVAL = 400 # Log progress every N documents
 
 # --- Core Transfer Logic ---
 def transfer_collection(source_db, dest_db, collection_name, subcollections=None):
@@ -51,54 +51,39 @@ def transfer_collection(source_db, dest_db, collection_name, subcollections=None
     
     docs_stream = source_collection_ref.stream()
     
-    batch = dest_db.batch()
-    batch_count = 0
+    # Parallel batches with ramp-up and retries instead of fixed pauses between batches
+    engine = WriteEngine(dest_db)
     doc_count = 0
 
     for doc in docs_stream:
         doc_count += 1
         dest_doc_ref = dest_db.collection(collection_name).document(doc.id)
-        batch.set(dest_doc_ref, doc.to_dict())
-        batch_count += 1
+        engine.set(dest_doc_ref, doc.to_dict())
 
-        if batch_count >= BATCH_SIZE:
-            batch.commit()
-            logger.info(f"  Committed batch for '{collection_name}'. Total docs transferred: {doc_count}")
-            batch = dest_db.batch()
-            batch_count = 0
-            time.sleep(0.1) # Small pause to avoid hitting write limits too fast
+        if doc_count % PROGRESS_INTERVAL == 0:
+            logger.info(f"  Queued {doc_count} docs for '{collection_name}'. Total writes completed: {engine.written}")
 
         if subcollections and doc.exists:
             for sub_name in subcollections:
                 logger.debug(f"    Transferring subcollection '{sub_name}' for doc '{doc.id}'")
                 source_sub_ref = source_collection_ref.document(doc.id).collection(sub_name)
                 
-                sub_batch = dest_db.batch()
-                sub_batch_count = 0
                 sub_doc_count = 0
 
                 for sub_doc in source_sub_ref.stream():
                     sub_doc_count += 1
                     dest_sub_doc_ref = dest_doc_ref.collection(sub_name).document(sub_doc.id)
-                    sub_batch.set(dest_sub_doc_ref, sub_doc.to_dict())
-                    sub_batch_count += 1
+                    engine.set(dest_sub_doc_ref, sub_doc.to_dict())
 
-                    if sub_batch_count >= BATCH_SIZE:
-                        sub_batch.commit()
-                        logger.debug(f"      Committed sub-batch for '{sub_name}'. Total sub-docs transferred: {sub_doc_count}")
-                        sub_batch = dest_db.batch()
-                        sub_batch_count = 0
-                        time.sleep(0.05) # Smaller pause for sub-batches
+                logger.debug(f"      Queued {sub_doc_count} sub-docs for '{sub_name}'")
 
-                if sub_batch_count > 0:
-                    sub_batch.commit()
-                    logger.debug(f"      Committed final sub-batch for '{sub_name}'. Total sub-docs transferred: {sub_doc_count}")
+    # Wait for every queued write, including sub-collection docs
+    failures = engine.close()
+    for failure in failures:
+        logger.error(f"  Failed to transfer {describe_failure(failure)}")
 
-    if batch_count > 0:
-        batch.commit()
-        logger.info(f"  Committed final batch for '{collection_name}'. Total docs transferred: {doc_count}")
-
-    logger.info(f"Finished transfer for collection: '{collection_name}'. Total documents: {doc_count}")
+    logger.info(f"Finished transfer for collection: '{collection_name}'. Total documents: {doc_count}, "
+                f"writes completed: {engine.written}, failed: {engine.failed}")
 
 
 # --- Main Cloning Function ---
@@ -0,0 +1,132 @@
+import json
+import random
+import time
+
+from script14 import (
+    HAMMING_THRESHOLD, ImageHashStore, PHashMatrix, bit_distance, hamming_distance, phash_to_int
+)
+
+# ---- CONFIGURATION ---- #
+EXPORT_FILE = "filehashed_data.json"  # Real pHashes exported by script19.py
+CORPUS_SIZES = [1000, 5000, 10000]    # Number of images in each simulated dedup pass
+NEAR_DUPLICATE_RATE = 0.2             # Share of images that are re-uploads of an earlier one
+SWEEP_SIZES = [20000, 50000]           # Synthetic corpus sizes for the vectorized all-pairs sweep
+RANDOM_SEED = 42
+
+# ---- BASELINE: THE ORIGINAL LIST SCAN ---- #
+class ListScanStore:
+    """The list-based store script14.py used before the multi-index pHash index"""
+    def __init__(self):
+        self.hashes = []
+
+    def add(self, phash, url, paper_doc_id):
+        self.hashes.append({
+            "phash": phash,
+            "url": url,
+            "paperDocId": paper_doc_id
+        })
+
+    def find_similar(self, phash, threshold=HAMMING_THRESHOLD):
+        value = phash_to_int(phash)
+        for item in self.hashes:
+            if bit_distance(phash_to_int(item["phash"]), value) <= threshold:
+                return item
+        return None
+
+# ---- CORPUS GENERATION ---- #
+def load_exported_phashes(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return [doc["pHash"] for doc in json.load(f) if doc.get("pHash")]
+    except FileNotFoundError:
+        return []
+
+def flip_bits(phash, count, rng):
+    value = phash_to_int(phash)
+    for bit in rng.sample(range(64), count):
+        value ^= 1 << bit
+    return f"{value:016x}"
+
+def build_corpus(size, seed_hashes, rng):
+    """Real pHashes first, then random ones, with a share of near-duplicate re-uploads"""
+    corpus = []
+    for i in range(size):
+        if corpus and rng.random() < NEAR_DUPLICATE_RATE:
+            corpus.append(flip_bits(rng.choice(corpus), rng.randint(0, HAMMING_THRESHOLD), rng))
+        elif i < len(seed_hashes):
+            corpus.append(seed_hashes[i])
+        else:
+            corpus.append(f"{rng.getrandbits(64):016x}")
+    return corpus
+
+# ---- BENCHMARK ---- #
+def run_dedup_pass(store, corpus):
+    """Same find-then-add sequence process_file performs for every image"""
+    matches = 0
+    start = time.perf_counter()
+    for i, phash in enumerate(corpus):
+        if store.find_similar(phash):
+            matches += 1
+        else:
+            store.add(phash, f"url-{i}", f"paper-{i}")
+    return time.perf_counter() - start, matches
+
+def python_sweep(phashes, threshold=HAMMING_THRESHOLD):
+    """All-pairs comparison one hamming_distance call at a time"""
+    pairs = 0
+    for i in range(len(phashes)):
+        for j in range(i + 1, len(phashes)):
+            if hamming_distance(phashes[i], phashes[j]) <= threshold:
+                pairs += 1
+    return pairs
+
+def vectorized_sweep(phashes, threshold=HAMMING_THRESHOLD):
+    matrix = PHashMatrix()
+    for i, phash in enumerate(phashes):
+        matrix.add(phash, i)
+    return sum(1 for _ in matrix.pairs_within(threshold))
+
+def benchmark_sweep(seed_hashes, rng):
+    print("\nFull-corpus similarity sweep")
+    print(f"{'images':>8} {'python (s)':>11} {'numpy (s)':>10} {'pairs':>8}")
+
+    start = time.perf_counter()
+    python_pairs = python_sweep(seed_hashes)
+    python_time = time.perf_counter() - start
+    start = time.perf_counter()
+    numpy_pairs = vectorized_sweep(seed_hashes)
+    numpy_time = time.perf_counter() - start
+    if python_pairs != numpy_pairs:
+        print(f"  Mismatch on export: python={python_pairs}, numpy={numpy_pairs}")
+    print(f"{len(seed_hashes):>8} {python_time:>11.3f} {numpy_time:>10.3f} {numpy_pairs:>8}")
+
+    for size in SWEEP_SIZES:
+        corpus = build_corpus(size, seed_hashes, rng)
+        start = time.perf_counter()
+        numpy_pairs = vectorized_sweep(corpus)
+        numpy_time = time.perf_counter() - start
+        print(f"{size:>8} {'-':>11} {numpy_time:>10.3f} {numpy_pairs:>8}")
+
+def benchmark():
+    rng = random.Random(RANDOM_SEED)
+    seed_hashes = load_exported_phashes(EXPORT_FILE)
+    print(f"Loaded {len(seed_hashes)} real pHashes from {EXPORT_FILE}")
+    print(f"\nIncremental dedup pass")
+    print(f"{'images':>8} {'list scan (s)':>14} {'index (s)':>12} {'speedup':>8} {'matches':>8}")
+
+    for size in CORPUS_SIZES:
+        corpus = build_corpus(size, seed_hashes, rng)
+        scan_time, scan_matches = run_dedup_pass(ListScanStore(), corpus)
+        index_time, index_matches = run_dedup_pass(ImageHashStore(), corpus)
+
+        # The index must find a match exactly when the scan does
+        if scan_matches != index_matches:
+            print(f"  Mismatch at {size} images: scan={scan_matches}, index={index_matches}")
+
+        speedup = scan_time / index_time if index_time else float("inf")
+        print(f"{size:>8} {scan_time:>14.3f} {index_time:>12.3f} {speedup:>7.1f}x {index_matches:>8}")
+
+    benchmark_sweep(seed_hashes, rng)
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,147 @@
+import json
+import logging
+import sys
+import time
+
+from script14 import HAMMING_THRESHOLD, DedupIndex, build_documents
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger('offline_dedup')
+
+# ---- CONFIGURATION ---- #
+EXPORT_FILE = "filehashed_data.json"       # fileHashes export written by script19.py
+OUTPUT_FILE = "duplicates_offline.ndjson"  # One 'duplicates' record per line
+READ_CHUNK_SIZE = 1 << 16                  # Characters read from the export at a time
+
+# Fields that belong to the fileHashes document itself; everything else is paper data
+FILE_HASH_FIELDS = {"fileUrl", "fileHash", "pHash", "pageHashes", "courseId",
+                    "subcollection", "paperDocId", "documentId"}
+
+# ---- STREAMING EXPORT READER ---- #
+def iter_export_records(path, chunk_size=READ_CHUNK_SIZE):
+    """
+    Yield the records of a JSON array export one at a time.
+    Only the current chunk and the record being decoded are held in memory,
+    so exports larger than RAM can be scanned.
+    """
+    decoder = json.JSONDecoder()
+    in_array = False
+    buffer = ""
+    position = 0
+    with open(path, "r", encoding="utf-8") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            buffer = buffer[position:] + chunk
+            position = 0
+            while True:
+                while position < len(buffer) and buffer[position] in " \t\r\n,":
+                    position += 1
+                if position == len(buffer):
+                    break
+                if not in_array:
+                    if buffer[position] != "[":
+                        raise ValueError(f"{path} is not a JSON array export")
+                    in_array = True
+                    position += 1
+                    continue
+                if buffer[position] == "]":
+                    return
+                try:
+                    record, position = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    if not chunk:
+                        raise
+                    break  # Record continues in the next chunk
+                yield record
+            if not chunk:
+                if in_array:
+                    raise ValueError(f"{path} ended before the closing bracket")
+                return
+
+# ---- DUPLICATE DETECTION ---- #
+def load_columns(path):
+    """
+    First pass: keep only the columns needed for matching, one tuple per file.
+    Records for a URL that was exported more than once are counted only once.
+    """
+    columns = []
+    seen_urls = set()
+    for position, record in enumerate(iter_export_records(path)):
+        url = record.get("fileUrl")
+        if not url or not record.get("fileHash") or url in seen_urls:
+            continue
+        seen_urls.add(url)
+        columns.append((
+            record.get("uploadedAt") or record.get("createdAt") or "",
+            position,
+            url,
+            record["fileHash"],
+            record.get("pHash"),
+            record.get("pageHashes"),
+            record.get("paperDocId")
+        ))
+    return columns
+
+def find_duplicates(columns, threshold=HAMMING_THRESHOLD):
+    """
+    Replay files oldest-first through the same DedupIndex the live run uses, so the
+    earliest upload of a file is the original and later ones are its duplicates.
+    Returns {record position: (exact_match, similar_match)}.
+    """
+    dedup_index = DedupIndex(threshold)
+    matches = {}
+    for _, position, url, file_hash, phash, page_hashes, paper_doc_id in sorted(columns):
+        exact_match, similar_match = dedup_index.claim(file_hash, url, paper_doc_id, phash, page_hashes)
+        if exact_match or similar_match:
+            matches[position] = (exact_match, similar_match)
+    return matches
+
+def write_duplicates(path, matches, output_file):
+    """Second pass: emit a 'duplicates' record, exactly as script14.py builds it, per match"""
+    counts = {"exact": 0, "similar": 0}
+    with open(output_file, "w", encoding="utf-8") as out:
+        for position, record in enumerate(iter_export_records(path)):
+            if position not in matches:
+                continue
+            exact_match, similar_match = matches[position]
+            result = {
+                "fileUrl": record["fileUrl"],
+                "fileHash": record["fileHash"],
+                "pHash": record.get("pHash"),
+                "pageHashes": record.get("pageHashes"),
+                "courseId": record.get("courseId"),
+                "subcollection": record.get("subcollection"),
+                "paperDocId": record.get("paperDocId"),
+                "paperData": {k: v for k, v in record.items() if k not in FILE_HASH_FIELDS},
+                "exactMatch": exact_match,
+                "similarMatch": similar_match
+            }
+            _, duplicate_data = build_documents(result)
+            out.write(json.dumps(duplicate_data, ensure_ascii=False) + "\n")
+            counts[duplicate_data["type"]] += 1
+    return counts
+
+def run_offline_dedup(export_file=EXPORT_FILE, output_file=OUTPUT_FILE, threshold=HAMMING_THRESHOLD):
+    start = time.perf_counter()
+
+    logger.info(f"Loading {export_file}...")
+    columns = load_columns(export_file)
+    logger.info(f"Loaded {len(columns)} distinct files")
+
+    matches = find_duplicates(columns, threshold)
+    counts = write_duplicates(export_file, matches, output_file)
+
+    logger.info("✅ Offline duplicate detection completed.")
+    logger.info(f"Hamming threshold: {threshold}")
+    logger.info(f"Exact duplicates: {counts['exact']}")
+    logger.info(f"Similar duplicates: {counts['similar']}")
+    logger.info(f"Records written to {output_file} in {time.perf_counter() - start:.2f}s")
+
+# ---- RUN ---- #
+if __name__ == "__main__":
+    # Optional: python script25.py <threshold>
+    run_offline_dedup(threshold=int(sys.argv[1]) if len(sys.argv) > 1 else HAMMING_THRESHOLD)
@@ -0,0 +1,118 @@
+import csv
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from course_search import CourseSearchIndex, course_tokens, tokenize
+
+# ---- CONFIGURATION ---- #
+CSV_FILE = "asmr.csv"          # ~680 real courses
+SYNTHETIC_SIZE = 100000        # Synthetic courses built from the real departments and words
+QUERIES_PER_KIND = 200
+SCAN_QUERIES_PER_KIND = 20     # The linear scan baseline is slow on the synthetic set
+RANDOM_SEED = 42
+
+# ---- CORPORA ---- #
+def load_csv_rows(path):
+    rows = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            code = row["Course Code"]
+            if code and code not in rows:
+                rows[code] = (code, row["Course Name"], code.replace(" ", "").lower(), [])
+    return list(rows.values())
+
+def build_synthetic_rows(real_rows, size, rng):
+    """Courses with real department prefixes and names recombined from real name words"""
+    departments = sorted({"".join(filter(str.isalpha, code)) for code, _, _, _ in real_rows} - {""})
+    words = sorted({word for _, name, _, _ in real_rows for word in name.split() if len(word) > 2})
+    rows = {}
+    while len(rows) < size:
+        code = f"{rng.choice(departments)} {rng.randint(1000, 9999)}"
+        if code not in rows:
+            name = " ".join(rng.sample(words, rng.randint(2, 5)))
+            rows[code] = (code, name, code.replace(" ", "").lower(), [])
+    return list(rows.values())
+
+def make_typo(word, rng):
+    i = rng.randrange(1, len(word))
+    return word[:i] + rng.choice("abcdefghijklmnopqrstuvwxyz") + word[i + 1:]
+
+def build_queries(rows, rng):
+    """Realistic query mix, grouped by kind"""
+    long_words = [w for _, name, _, _ in rows for w in tokenize(name) if len(w) >= 6]
+    queries = {"exact code": [], "code prefix": [], "word prefix": [], "two words": [], "typo": [], "one letter": []}
+    for _ in range(QUERIES_PER_KIND):
+        code, name, _, _ = rng.choice(rows)
+        department, number = code.split(" ", 1) if " " in code else (code, "")
+        name_words = [w for w in tokenize(name) if len(w) >= 3] or [department.lower()]
+        queries["exact code"].append(code)
+        queries["code prefix"].append(f"{department} {number[:2]}")
+        queries["word prefix"].append(rng.choice(name_words)[:4])
+        queries["two words"].append(" ".join(w[:5] for w in rng.sample(name_words, min(2, len(name_words)))))
+        queries["typo"].append(make_typo(rng.choice(long_words), rng))
+        queries["one letter"].append(rng.choice("abcdefghijklmnopqrstuvwxyz"))
+    return queries
+
+# ---- BASELINE: LINEAR SCAN ---- #
+class LinearScan:
+    """Checks every course's tokens for each query term: what a client does without an index"""
+    def __init__(self, rows):
+        self.docs = sorted((row[0], row[1], course_tokens(*row)) for row in rows)
+
+    def search(self, query, limit=10):
+        terms = tokenize(query)
+        results = []
+        for course_id, name, tokens in self.docs:
+            if all(any(token.startswith(term) for token in tokens) for term in terms):
+                results.append((course_id, name))
+                if len(results) == limit:
+                    break
+        return results
+
+# ---- BENCHMARK ---- #
+def time_queries(engine, queries):
+    latencies = []
+    hits = 0
+    for query in queries:
+        start = time.perf_counter()
+        results = engine.search(query)
+        latencies.append((time.perf_counter() - start) * 1e6)
+        hits += bool(results)
+    latencies.sort()
+    return statistics.mean(latencies), latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)], hits
+
+def benchmark_corpus(label, rows, rng):
+    print(f"\n{label}: {len(rows)} courses")
+
+    start = time.perf_counter()
+    index = CourseSearchIndex.build(rows)
+    build_time = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "index.json.gz")
+        index.save(path)
+        size_kb = os.path.getsize(path) / 1024
+        start = time.perf_counter()
+        index = CourseSearchIndex.load(path)
+        load_time = time.perf_counter() - start
+    print(f"  build {build_time:.2f}s, artifact {size_kb:.0f} KB, load {load_time:.2f}s, {len(index.tokens)} tokens")
+
+    scan = LinearScan(rows)
+    queries = build_queries(rows, rng)
+    print(f"  {'query kind':<12} {'mean (us)':>10} {'p50 (us)':>9} {'p99 (us)':>9} {'hits':>5} {'scan mean (us)':>15}")
+    for kind, kind_queries in queries.items():
+        mean, p50, p99, hits = time_queries(index, kind_queries)
+        scan_mean = time_queries(scan, kind_queries[:SCAN_QUERIES_PER_KIND])[0]
+        print(f"  {kind:<12} {mean:>10.1f} {p50:>9.1f} {p99:>9.1f} {hits:>5} {scan_mean:>15.1f}")
+
+def benchmark():
+    rng = random.Random(RANDOM_SEED)
+    real_rows = load_csv_rows(CSV_FILE)
+    benchmark_corpus(CSV_FILE, real_rows, rng)
+    benchmark_corpus("Synthetic", build_synthetic_rows(real_rows, SYNTHETIC_SIZE, rng), rng)
+
+if __name__ == "__main__":
+    benchmark()
@@ -1,9 +1,15 @@
 import csv
 import firebase_admin
 from firebase_admin import credentials, firestore
+from course_counts import SUB_COLLECTIONS, count_papers, iter_course_refs
+from firestore_emulator import emulator_client
+from write_engine import WriteEngine, describe_failure
 
 
 def initialize_firebase(credentials_path):
+    emulator_db = emulator_client()
+    if emulator_db is not None:
+        return emulator_db
     try:
         cred = credentials.Certificate(credentials_path)
         firebase_admin.initialize_app(cred)
@@ -16,40 +22,30 @@ def update_course_totals(db):
     if not db:
         return
     
-    courses_ref = db.collection("courses")
+    engine = WriteEngine(db)
     try:
-        courses = courses_ref.stream()
-        
-        for course in courses:
+        # Only existing course docs are returned, so no per-course existence check is needed
+        for course in iter_course_refs(db):
             course_id = course.id
             total_papers = 0
-            
-            # Get existing document data
-            course_doc = courses_ref.document(course_id).get()
-            if not course_doc.exists:
-                print(f"Warning: Course {course_id} document doesn't exist")
-                continue
-                
-            for sub_collection in ["mid-semester", "end-semester", "quizzes"]:
+
+            for sub_collection in SUB_COLLECTIONS:
                 try:
-                    sub_collection_ref = courses_ref.document(course_id).collection(sub_collection)
-                    papers = list(sub_collection_ref.stream())  # Materialize the stream
-                    
-                    # Exclude placeholder doc
-                    real_papers = [doc for doc in papers if doc.id != "placeholder"]
-                    total_papers += len(real_papers)
+                    # Server-side count(), placeholder doc excluded
+                    total_papers += count_papers(course.collection(sub_collection))
                 except Exception as e:
                     print(f"Error processing {sub_collection} for {course_id}: {e}")
                     continue
             
-            try:
-                # Update course document with total_papers field
-                courses_ref.document(course_id).update({"total_papers": total_papers})
-                print(f"Updated {course_id} with total_papers: {total_papers}")
-            except Exception as e:
-                print(f"Failed to update {course_id}: {e}")
+            # Update course document with total_papers field
+            engine.update(course, {"total_papers": total_papers})
+            print(f"Updated {course_id} with total_papers: {total_papers}")
     except Exception as e:
         print(f"Failed to stream courses: {e}")
+    finally:
+        # Wait for the queued updates
+        for failure in engine.close():
+            print(f"Failed to update {describe_failure(failure)}")
 
 if __name__ == "__main__":
     db = initialize_firebase("campusaid-afe4b-firebase-adminsdk-i2di4-4484b29e45.json")
@@ -1,5 +1,11 @@
+import sys
 import firebase_admin
 from firebase_admin import credentials, firestore
+from change_writer import ChangeWriter
+from checkpoint import CheckpointedQuery
+from course_ranking import rerank_courses
+
+CHECKPOINT_FILE = "script9_checkpoint.json"
 
 def initialize_firebase(credentials_path: str) -> firestore.Client:
     """
@@ -13,20 +19,34 @@ def initialize_firebase(credentials_path: str) -> firestore.Client:
 def update_item_count(db: firestore.Client):
     """
     Fetch courses in alphabetical order and update item_count field.
+    Only courses whose stored item_count differs are written. Progress is
+    checkpointed after every page, so a stopped run resumes with the next
+    page and the right item_count.
     """
+    courses_query = db.collection('courses').select(["normalized_code", "item_count"])
+    courses = CheckpointedQuery(courses_query, CHECKPOINT_FILE, order_field="normalized_code")
+    if courses.resumed:
+        print(f"Resuming after {courses.last_id} ({courses.processed} courses already processed)")
+    writer = ChangeWriter(db)
+
     try:
-        courses_ref = db.collection('courses')
-        courses = courses_ref.order_by("normalized_code").stream()
-        
-        for index, course in enumerate(courses, start=1):
-            course_ref = courses_ref.document(course.id)
-            course_ref.update({"item_count": index})
-            print(f"Updated {course.id} with item_count {index}")
+        for page in courses.pages():
+            for position, course in enumerate(page, start=courses.processed + 1):
+                if writer.update(course.reference, course.to_dict(), {"item_count": position}):
+                    print(f"Updated {course.id} with item_count {position}")
+            writer.flush()
+            courses.commit(page[-1], count=len(page))
         
-        print("Successfully updated all courses with item_count.")
+        print(f"Successfully updated all courses with item_count ({writer.summary()}).")
+        courses.finish()
     except Exception as e:
         print(f"Error updating item_count: {e}")
 
 if __name__ == "__main__":
     db = initialize_firebase("campusaid-afe4b-firebase-adminsdk-i2di4-4484b29e45.json")
-    update_item_count(db)
+    # Default: rank in memory and write only the shifted range.
+    # Optional: python script9.py --resumable  (paged and checkpointed, for very large collections)
+    if "--resumable" in sys.argv:
+        update_item_count(db)
+    else:
+        rerank_courses(db)
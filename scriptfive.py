@@ -1,6 +1,7 @@
-import csv
+import sys
 import firebase_admin
 from firebase_admin import credentials, firestore
+from course_import import OVERWRITE, UPSERT_CHANGED, import_courses, print_import_summary
 
 def normalize_code(code):
     """
@@ -22,7 +23,23 @@ def generate_searchable_fields(course_data):
     searchable_fields = set(course_name_tokens + normalized_code_tokens + numeric_tokens)
     return list(searchable_fields)
 
-def import_and_update_courses(csv_file_path):
+def build_course_document(course_code, course_name, school):
+    """
+    Course document fields, including the derived search fields, for one CSV row
+    """
+    normalized_code = normalize_code(course_code)
+    return {
+        'course_name': course_name,
+        'normalized_code': normalized_code,
+        'school': school,
+        'course_name_lowercase': course_name.lower(),
+        'searchable_fields': generate_searchable_fields({
+            'course_name': course_name,
+            'normalized_code': normalized_code
+        })
+    }
+
+def import_and_update_courses(csv_file_path, mode=OVERWRITE):
     """
     Import courses from CSV to Firebase Firestore and update documents
     """
@@ -33,54 +50,11 @@ def import_and_update_courses(csv_file_path):
     # Get Firestore client
     db = firestore.client()
     
-    # Dictionary to track processed courses to avoid duplicates
-    processed_courses = set()
-    
-    # Open and read the CSV file
-    with open(csv_file_path, 'r', encoding='utf-8') as csvfile:
-        csvreader = csv.DictReader(csvfile)
-        
-        for row in csvreader:
-            course_code = row['Course Code']
-            course_name = row['Course Name']
-            school = row['source']
-            
-            # Skip if course has already been processed or empty course code
-            if not course_code or course_code in processed_courses:
-                continue
-            
-            # Normalize the course code
-            normalized_code = normalize_code(course_code)
-            
-            # Reference to the course document
-            course_ref = db.collection('courses').document(course_code)
-            
-            # Set course document data
-            course_data = {
-                'course_name': course_name,
-                'normalized_code': normalized_code,
-                'school': school,
-                'course_name_lowercase': course_name.lower(),
-                'searchable_fields': generate_searchable_fields({
-                    'course_name': course_name,
-                    'normalized_code': normalized_code
-                })
-            }
-            
-            course_ref.set(course_data)
-            
-            # Create subcollections for end-semester, mid-semester, and quizzes
-            course_ref.collection('end-semester').document('placeholder').set({})
-            course_ref.collection('mid-semester').document('placeholder').set({})
-            course_ref.collection('quizzes').document('placeholder').set({})
-            
-            # Mark course as processed
-            processed_courses.add(course_code)
-            
-            print(f"Imported and updated course: {course_code} - {course_name}")
-    
-    print(f"Total courses imported and updated: {len(processed_courses)}")
+    # New courses also get empty placeholder docs in end-semester, mid-semester and quizzes
+    stats = import_courses(db, csv_file_path, build_course_document, mode)
+    print_import_summary(stats)
 
 # Usage
 if __name__ == "__main__":
-    import_and_update_courses('asmr.csv')
\ No newline at end of file
+    # Optional: python scriptfive.py --upsert  (only write fields that changed)
+    import_and_update_courses('asmr.csv', UPSERT_CHANGED if "--upsert" in sys.argv else OVERWRITE)
\ No newline at end of file
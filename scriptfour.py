@@ -1,55 +1,54 @@
+import sys
 import firebase_admin
 from firebase_admin import credentials, firestore
+from checkpoint import CheckpointedQuery
+from course_pipeline import generate_searchable_fields
+from derived_fields import IncrementalDeriver
 
 # Initialize Firestore
 cred = credentials.Certificate("linguo-cbb63-firebase-adminsdk-9earb-832e97d49c.json")
 firebase_admin.initialize_app(cred)
 db = firestore.client()
 
-# Function to generate searchable fields
-def generate_searchable_fields(course_data):
-    # Extract relevant fields
-    course_name = course_data.get("course_name", "")
-    normalized_code = course_data.get("normalized_code", "")
-
-    # Generate tokens from course_name and normalized_code
-    course_name_tokens = course_name.lower().split()  # Split by spaces
-    normalized_code_tokens = [normalized_code.lower()]
-
-    # Extract numeric substrings from normalized_code
-    numeric_tokens = ["".join(filter(str.isdigit, normalized_code))]
-
-    # Combine all tokens into searchable_fields
-    searchable_fields = set(course_name_tokens + normalized_code_tokens + numeric_tokens)
-
-    return list(searchable_fields)
-
 # Firestore collection name
 collection_name = "courses"
+CHECKPOINT_FILE = "scriptfour_checkpoint.json"
+FINGERPRINT_FILE = "scriptfour_fingerprints.json"
 
 # Update documents in Firestore
-def update_searchable_fields():
-    courses_collection = db.collection(collection_name)
+def update_searchable_fields(full=False):
+    # Only courses whose course_name or normalized_code changed since the last run are recomputed;
+    # searchable_fields is built from a set, so its order alone is not a change
+    deriver = IncrementalDeriver(
+        db, FINGERPRINT_FILE, ["course_name", "normalized_code"], ["searchable_fields"],
+        lambda data: {"searchable_fields": generate_searchable_fields(data)},
+        unordered_fields=["searchable_fields"], full=full
+    )
+
+    # Pages through the collection, resuming after the last committed page
+    docs = CheckpointedQuery(db.collection(collection_name).select(deriver.read_fields), CHECKPOINT_FILE)
+    if docs.resumed:
+        print(f"Resuming after {docs.last_id} ({docs.processed} documents already processed)")
     
     try:
-        # Fetch all documents in the collection
-        docs = courses_collection.stream()
-
-        for doc in docs:
-            data = doc.to_dict()
-
-            # Generate searchable fields
-            searchable_fields = generate_searchable_fields(data)
+        for page in docs.pages():
+            for doc in page:
+                # Queue the update only if the inputs and the stored value changed
+                updated = deriver.process(doc)
+                if updated:
+                    print(f"Updated document {doc.id} with searchable_fields: {updated['searchable_fields']}")
 
-            # Update the document with searchable fields
-            courses_collection.document(doc.id).update({
-                "searchable_fields": searchable_fields
-            })
+            deriver.flush()
+            docs.commit(page[-1], count=len(page))
 
-            print(f"Updated document {doc.id} with searchable_fields: {searchable_fields}")
+        # A resumed run did not see the earlier pages, so keep their fingerprints
+        deriver.finish(prune=not docs.resumed)
+        print(f"Documents {deriver.summary()}")
+        docs.finish()
 
     except Exception as e:
         print(f"Error updating documents: {e}")
 
 if __name__ == "__main__":
-    update_searchable_fields()
+    # Optional: python scriptfour.py --full  (recheck every course, not just changed ones)
+    update_searchable_fields(full="--full" in sys.argv)
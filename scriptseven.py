@@ -1,30 +1,31 @@
 import firebase_admin
 from firebase_admin import credentials, firestore
+from course_counts import count_course_papers, iter_course_refs
+from firestore_emulator import emulator_client
+from write_engine import WriteEngine, describe_failure
 
 # Initialize Firebase
-cred = credentials.Certificate("linguo-cbb63-firebase-adminsdk-9earb-832e97d49c.json") # Replace with your Firebase service account key
-firebase_admin.initialize_app(cred)
-db = firestore.client()
+db = emulator_client()
+if db is None:
+    cred = credentials.Certificate("linguo-cbb63-firebase-adminsdk-9earb-832e97d49c.json") # Replace with your Firebase service account key
+    firebase_admin.initialize_app(cred)
+    db = firestore.client()
 
 def update_course_totals():
-    courses_ref = db.collection("courses")
-    courses = courses_ref.stream()
-    
-    for course in courses:
+    engine = WriteEngine(db)
+    for course in iter_course_refs(db):
         course_id = course.id  # Course name, e.g., "SWE 2020"
-        total_papers = 0
-        
-        for sub_collection in ["mid-semester", "end-semester", "quizzes"]:
-            sub_collection_ref = courses_ref.document(course_id).collection(sub_collection)
-            papers = sub_collection_ref.stream()
-            
-            # Exclude placeholder doc
-            real_papers = [doc for doc in papers if doc.id != "placeholder"]
-            total_papers += len(real_papers)
-        
+
+        # Server-side count() per sub-collection, placeholder doc excluded
+        total_papers = count_course_papers(course)["total_papers"]
+
         # Update course document with total_papers field
-        courses_ref.document(course_id).update({"total_papers": total_papers})
+        engine.update(course, {"total_papers": total_papers})
         print(f"Updated {course_id} with total_papers: {total_papers}")
 
+    # Wait for the queued updates
+    for failure in engine.close():
+        print(f"Failed to update {describe_failure(failure)}")
+
 if __name__ == "__main__":
     update_course_totals()
@@ -1,5 +1,7 @@
 import firebase_admin
 from firebase_admin import credentials, firestore
+import sys
+from derived_fields import IncrementalDeriver
 
 # Initialize Firebase Admin SDK
 cred = credentials.Certificate("collectionscript\campusaid-afe4b-firebase-adminsdk-i2di4-4484b29e45.json")  # Replace with your service account key path
@@ -10,32 +12,34 @@ db = firestore.client()
 
 # Reference to the lecturers collection
 lecturers_ref = db.collection("lecturers")
+FINGERPRINT_FILE = "scriptsix_fingerprints.json"
 
-def update_lecturers():
+def derive_lecturer_fields(doc_data):
+    # Generate lowercaseName and searchableFields
+    lowercase_name = doc_data.get("name", "").lower()
+    return {
+        "lowercaseName": lowercase_name,
+        "searchableFields": lowercase_name.split(" ")
+    }
+
+def update_lecturers(full=False):
     try:
-        # Fetch all documents in the lecturers collection
-        docs = lecturers_ref.stream()
+        # Only lecturers whose name changed since the last run are recomputed and written
+        deriver = IncrementalDeriver(db, FINGERPRINT_FILE, ["name"], ["lowercaseName", "searchableFields"],
+                                     derive_lecturer_fields, full=full)
+        docs = lecturers_ref.select(deriver.read_fields).stream()
 
         for doc in docs:
-            doc_data = doc.to_dict()
-            lecturer_name = doc_data.get("name", "")
-
-            # Generate lowercaseName and searchableFields
-            lowercase_name = lecturer_name.lower()
-            searchable_fields = lowercase_name.split(" ")
-
-            # Update the document with new fields
-            doc.reference.update({
-                "lowercaseName": lowercase_name,
-                "searchableFields": searchable_fields
-            })
-
-            print(f"Updated document {doc.id} with lowercaseName: {lowercase_name} and searchableFields: {searchable_fields}")
+            updated = deriver.process(doc)
+            if updated:
+                print(f"Updated document {doc.id} with {updated}")
 
-        print("All documents updated successfully!")
+        deriver.finish()
+        print(f"All documents updated successfully! ({deriver.summary()})")
 
     except Exception as e:
         print(f"Error updating documents: {e}")
 
 # Run the update function
-update_lecturers()
\ No newline at end of file
+# Optional: python scriptsix.py --full  (recheck every lecturer, not just changed ones)
+update_lecturers(full="--full" in sys.argv)
\ No newline at end of file
@@ -1,6 +1,8 @@
 import firebase_admin
 from firebase_admin import credentials, firestore
 import os
+import sys
+from derived_fields import IncrementalDeriver
 
 # Path to your Firebase service account key
 # Replace with the path to your service account JSON file
@@ -13,47 +15,34 @@ firebase_admin.initialize_app(cred)
 # Get Firestore client
 db = firestore.client()
 
-def update_course_documents():
+FINGERPRINT_FILE = 'scriptthree_fingerprints.json'
+
+def derive_course_fields(doc_dict):
+    return {
+        'course_name_lowercase': doc_dict.get('course_name', '').lower()
+    }
+
+def update_course_documents(full=False):
     # Reference to the courses collection
     courses_ref = db.collection('courses')
 
-    # Fetch all documents
-    docs = courses_ref.stream()
-
-    # Batch to handle updates
-    batch = db.batch()
-    update_count = 0
+    # Only courses whose course_name changed since the last run are recomputed and written
+    deriver = IncrementalDeriver(db, FINGERPRINT_FILE, ['course_name'], ['course_name_lowercase'],
+                                 derive_course_fields, full=full)
+    docs = courses_ref.select(deriver.read_fields).stream()
 
     for doc in docs:
-        # Get the document data
-        doc_dict = doc.to_dict()
-
-        # Prepare update data
-        update_data = {
-            'course_name_lowercase': doc_dict.get('course_name', '').lower()
-        }
-
-        # Add update to batch
-        batch.update(courses_ref.document(doc.id), update_data)
-        update_count += 1
-
-        # Firestore batch writes are limited to 500 operations
-        if update_count % 500 == 0:
-            # Commit the batch
-            batch.commit()
-            print(f"Committed batch of 500 updates. Total updated: {update_count}")
-            # Start a new batch
-            batch = db.batch()
+        deriver.process(doc)
 
     # Commit any remaining updates
-    if update_count % 500 != 0:
-        batch.commit()
+    deriver.finish()
 
-    print(f"Total documents updated: {update_count}")
+    print(f"Documents {deriver.summary()}")
 
 def main():
     try:
-        update_course_documents()
+        # Optional: python scriptthree.py --full  (recheck every course, not just changed ones)
+        update_course_documents(full="--full" in sys.argv)
         print("Document update process completed successfully.")
     except Exception as e:
         print(f"An error occurred: {e}")
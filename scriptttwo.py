@@ -1,6 +1,7 @@
-import csv
+import sys
 import firebase_admin
 from firebase_admin import credentials, firestore
+from course_import import OVERWRITE, UPSERT_CHANGED, import_courses, print_import_summary
 
 def normalize_code(code):
     """
@@ -8,7 +9,17 @@ def normalize_code(code):
     """
     return code.replace(' ', '').lower()
 
-def import_courses_to_firebase(csv_file_path):
+def build_course_document(course_code, course_name, school):
+    """
+    Course document fields for one CSV row
+    """
+    return {
+        'course_name': course_name,
+        'normalized_code': normalize_code(course_code),
+        'school': school
+    }
+
+def import_courses_to_firebase(csv_file_path, mode=OVERWRITE):
     """
     Import courses from CSV to Firebase Firestore
     """
@@ -19,48 +30,11 @@ def import_courses_to_firebase(csv_file_path):
     # Get Firestore client
     db = firestore.client()
     
-    # Dictionary to track processed courses to avoid duplicates
-    processed_courses = set()
-    
-    # Open and read the CSV file
-    with open(csv_file_path, 'r', encoding='utf-8') as csvfile:
-        csvreader = csv.DictReader(csvfile)
-        
-        for row in csvreader:
-            course_code = row['Course Code']
-            course_name = row['Course Name']
-            school = row['source']
-            
-            # Skip if course has already been processed or empty course code
-            if not course_code or course_code in processed_courses:
-                continue
-            
-            # Normalize the course code
-            normalized_code = normalize_code(course_code)
-            
-            # Reference to the course document
-            course_ref = db.collection('courses').document(course_code)
-            
-            # Set course document data
-            course_ref.set({
-                'course_name': course_name,
-                'normalized_code': normalized_code,
-                'school': school
-            })
-            
-            # Create subcollections for end-semester, mid-semester, and quizzes
-            # These will be empty but ready for future use
-            course_ref.collection('end-semester').document('placeholder').set({})
-            course_ref.collection('mid-semester').document('placeholder').set({})
-            course_ref.collection('quizzes').document('placeholder').set({})
-            
-            # Mark course as processed
-            processed_courses.add(course_code)
-            
-            print(f"Imported course: {course_code} - {course_name}")
-    
-    print(f"Total courses imported: {len(processed_courses)}")
+    # New courses also get empty placeholder docs in end-semester, mid-semester and quizzes
+    stats = import_courses(db, csv_file_path, build_course_document, mode)
+    print_import_summary(stats)
 
 # Usage
 if __name__ == "__main__":
-    import_courses_to_firebase('asmr.csv')
\ No newline at end of file
+    # Optional: python scriptttwo.py --upsert  (only write fields that changed)
+    import_courses_to_firebase('asmr.csv', UPSERT_CHANGED if "--upsert" in sys.argv else OVERWRITE)
\ No newline at end of file
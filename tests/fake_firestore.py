@@ -0,0 +1,312 @@
+"""
+In-memory stand-in for the part of the Firestore client the shared engines use:
+collection / collection_group queries with where(filter=FieldFilter) (document-ID
+filters included), select, order_by, limit, start_after and stream, count() / sum() /
+avg() aggregation queries, and a BulkWriter.
+Documents live in FakeFirestore.docs keyed by path ("lecturers/L1/reviews/r1").
+"""
+import uuid
+
+_MISSING = object()
+DOCUMENT_ID = "__name__"  # firestore.FieldPath.document_id()
+
+class FakeSnapshot:
+    def __init__(self, reference, data, fields=None):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        if data is not None and fields is not None:
+            data = {field: data[field] for field in fields if field in data}
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return self._data.get(field)
+
+class FakeAggregationResult:
+    def __init__(self, alias, value):
+        self.alias = alias
+        self.value = value
+
+class FakeAggregationQuery:
+    def __init__(self, query):
+        self.query = query
+        self.aggregations = []
+
+    def count(self, alias=None):
+        self.aggregations.append(("count", None, alias or "count"))
+        return self
+
+    def sum(self, field, alias=None):
+        self.aggregations.append(("sum", field, alias or "sum"))
+        return self
+
+    def avg(self, field, alias=None):
+        self.aggregations.append(("avg", field, alias or "avg"))
+        return self
+
+    def get(self):
+        self.query.client.aggregation_requests += 1
+        data = [data for _, data in self.query._matching()]
+        results = []
+        for kind, field, alias in self.aggregations:
+            if kind == "count":
+                value = len(data)
+            else:
+                # Like Firestore, sum() and avg() skip non-numeric values
+                numbers = [d[field] for d in data if isinstance(d.get(field), (int, float)) and not isinstance(d.get(field), bool)]
+                if kind == "sum":
+                    value = sum(numbers)
+                else:
+                    value = sum(numbers) / len(numbers) if numbers else None
+            results.append(FakeAggregationResult(alias, value))
+        return [results]
+
+def _op_name(op_string):
+    # FieldFilter turns "==" / "!=" against None into IS_NULL / IS_NOT_NULL enums
+    return getattr(op_string, "name", op_string)
+
+def _field_value(path, data, field):
+    if field == DOCUMENT_ID:
+        return path
+    return data.get(field, _MISSING)
+
+def _document_path(path, value):
+    """A document-ID filter or cursor value (reference, path or bare ID) as a full path"""
+    value = getattr(value, "path", value)
+    return value if "/" in value else f"{path.rsplit('/', 1)[0]}/{value}"
+
+def _matches(field_filter, path, data):
+    value = _field_value(path, data, field_filter.field_path)
+    if value is _MISSING:
+        return False  # Firestore filters never match documents lacking the field
+    op = _op_name(field_filter.op_string)
+    if op in ("IS_NULL", "IS_NOT_NULL"):
+        return (value is None) == (op == "IS_NULL")
+    target = field_filter.value
+    if field_filter.field_path == DOCUMENT_ID:
+        target = _document_path(path, target)
+    if op == "==":
+        return value == target
+    if op == "!=":
+        return value is not None and value != target
+    if value is None or type(value) is not type(target):
+        return False
+    return {"<": value < target, "<=": value <= target, ">": value > target, ">=": value >= target}[op]
+
+def _sort_key(value):
+    # Like Firestore, null sorts before every other value
+    return (value is not None, value if value is not None else 0)
+
+class FakeQuery:
+    def __init__(self, client, collection_path=None, group=None, filters=(), fields=None,
+                 orders=(), limit_count=None, cursor=None):
+        self.client = client
+        self.collection_path = collection_path
+        self.group = group
+        self.filters = list(filters)
+        self.fields = fields
+        self.orders = list(orders)
+        self.limit_count = limit_count
+        self.cursor = cursor
+
+    def _copy(self, **changes):
+        values = dict(
+            collection_path=self.collection_path, group=self.group, filters=self.filters, fields=self.fields,
+            orders=self.orders, limit_count=self.limit_count, cursor=self.cursor
+        )
+        values.update(changes)
+        return FakeQuery(self.client, **values)
+
+    def where(self, filter):
+        return self._copy(filters=self.filters + [filter])
+
+    def select(self, field_paths):
+        return self._copy(fields=list(field_paths))
+
+    def order_by(self, field_path):
+        return self._copy(orders=self.orders + [field_path])
+
+    def limit(self, count):
+        return self._copy(limit_count=count)
+
+    def start_after(self, cursor):
+        """cursor is a {field: value} dict over the order_by fields, as CheckpointedQuery builds it"""
+        return self._copy(cursor=dict(cursor))
+
+    def _order_fields(self):
+        # Document ID always breaks ties last, as Firestore adds it implicitly
+        return self.orders + ([DOCUMENT_ID] if DOCUMENT_ID not in self.orders else [])
+
+    def _order_key(self, path, data):
+        return tuple(_sort_key(_field_value(path, data, field)) for field in self._order_fields())
+
+    def _cursor_key(self, path):
+        return tuple(
+            _sort_key(_document_path(path, self.cursor[field]) if field == DOCUMENT_ID else self.cursor[field])
+            for field in self._order_fields()
+        )
+
+    def _matching(self):
+        matching = []
+        for path in sorted(self.client.docs):
+            parent_path, _ = path.rsplit("/", 1)
+            if self.collection_path is not None and parent_path != self.collection_path:
+                continue
+            if self.group is not None and parent_path.rsplit("/", 1)[-1] != self.group:
+                continue
+            data = self.client.docs[path]
+            # order_by leaves out documents lacking the field, like an inequality filter
+            if any(_field_value(path, data, field) is _MISSING for field in self.orders):
+                continue
+            if all(_matches(f, path, data) for f in self.filters):
+                matching.append((path, data))
+        matching.sort(key=lambda item: self._order_key(*item))
+        if self.cursor is not None:
+            matching = [(path, data) for path, data in matching if self._order_key(path, data) > self._cursor_key(path)]
+        if self.limit_count is not None:
+            matching = matching[:self.limit_count]
+        return matching
+
+    def stream(self):
+        for path, data in list(self._matching()):
+            self.client.document_reads += 1
+            yield FakeSnapshot(self.client.document(path), data, self.fields)
+
+    def count(self, alias=None):
+        return FakeAggregationQuery(self).count(alias)
+
+    def sum(self, field, alias=None):
+        return FakeAggregationQuery(self).sum(field, alias)
+
+    def avg(self, field, alias=None):
+        return FakeAggregationQuery(self).avg(field, alias)
+
+class FakeCollection(FakeQuery):
+    def __init__(self, client, path):
+        super().__init__(client, collection_path=path)
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    @property
+    def parent(self):
+        return self.client.document(self.path.rsplit("/", 1)[0]) if "/" in self.path else None
+
+    def document(self, document_id=None):
+        # Like Firestore, no ID means a new random one
+        document_id = document_id or uuid.uuid4().hex[:20]
+        return FakeDocumentReference(self.client, f"{self.path}/{document_id}")
+
+class FakeDocumentReference:
+    def __init__(self, client, path):
+        self.client = client
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    @property
+    def parent(self):
+        return FakeCollection(self.client, self.path.rsplit("/", 1)[0])
+
+    def collection(self, collection_id):
+        return FakeCollection(self.client, f"{self.path}/{collection_id}")
+
+    def get(self):
+        self.client.document_reads += 1
+        return FakeSnapshot(self, self.client.docs.get(self.path))
+
+class FakeOperation:
+    def __init__(self, reference):
+        self.reference = reference
+
+class FakeWriteFailure:
+    def __init__(self, reference, code, message, attempts):
+        self.operation = FakeOperation(reference)
+        self.code = code
+        self.message = message
+        self.attempts = attempts
+
+class FakeBulkWriter:
+    """Applies writes on flush; update() of a missing document fails with NOT_FOUND"""
+    def __init__(self, client):
+        self.client = client
+        self.queued = []
+        self.result_callback = None
+        self.error_callback = None
+
+    def on_write_result(self, callback):
+        self.result_callback = callback
+
+    def on_write_error(self, callback):
+        self.error_callback = callback
+
+    def create(self, reference, data):
+        self.queued.append(("create", reference, data))
+
+    def set(self, reference, data, merge=False):
+        self.queued.append(("merge" if merge else "set", reference, data))
+
+    def update(self, reference, data):
+        self.queued.append(("update", reference, data))
+
+    def delete(self, reference):
+        self.queued.append(("delete", reference, None))
+
+    def _apply(self, kind, reference, data):
+        docs = self.client.docs
+        if kind == "update" and reference.path not in docs:
+            return 5, "no document to update"
+        if kind == "create" and reference.path in docs:
+            return 6, "document already exists"
+        if kind == "delete":
+            docs.pop(reference.path, None)
+        elif kind in ("update", "merge"):
+            docs.setdefault(reference.path, {}).update(data)
+        else:
+            docs[reference.path] = dict(data)
+        self.client.writes.append((kind, reference.path, data))
+        return None, None
+
+    def flush(self):
+        queued, self.queued = self.queued, []
+        for kind, reference, data in queued:
+            attempts = 0
+            while True:
+                attempts += 1
+                code, message = self._apply(kind, reference, data)
+                if code is None:
+                    if self.result_callback:
+                        self.result_callback(reference, None, self)
+                    break
+                failure = FakeWriteFailure(reference, code, message, attempts)
+                if not (self.error_callback and self.error_callback(failure, self)):
+                    break
+
+    def close(self):
+        self.flush()
+
+class FakeFirestore:
+    """
+    In-memory Firestore client. Counters for assertions:
+      document_reads        documents returned by stream() / get()
+      aggregation_requests  count() / sum() / avg() requests
+      writes                (kind, path, data) of every write applied
+    """
+    def __init__(self, docs=None):
+        self.docs = {path: dict(data) for path, data in (docs or {}).items()}
+        self.document_reads = 0
+        self.aggregation_requests = 0
+        self.writes = []
+
+    def collection(self, collection_id):
+        return FakeCollection(self, collection_id)
+
+    def collection_group(self, collection_id):
+        return FakeQuery(self, group=collection_id)
+
+    def document(self, path):
+        return FakeDocumentReference(self, path)
+
+    def bulk_writer(self, options=None):
+        return FakeBulkWriter(self)
@@ -0,0 +1,148 @@
+import concurrent.futures
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import course_counts
+import script16
+from checkpoint import CheckpointedQuery
+from tests.fake_firestore import FakeFirestore
+
+def sample_docs():
+    return {
+        # Stale counters; the placeholder is not a paper
+        "courses/C1": {"course_name": "Algebra", "total_papers": 0},
+        "courses/C1/mid-semester/placeholder": {},
+        "courses/C1/mid-semester/p1": {"fileUrl": "a"},
+        "courses/C1/mid-semester/p2": {"fileUrl": "b"},
+        "courses/C1/end-semester/p3": {"fileUrl": "c"},
+        "courses/C1/quizzes/placeholder": {},
+        # Stale counters, papers in every sub-collection
+        "courses/C2": {"course_name": "Biology", "total_papers": 7},
+        "courses/C2/mid-semester/p1": {"fileUrl": "d"},
+        "courses/C2/end-semester/p2": {"fileUrl": "e"},
+        "courses/C2/quizzes/p3": {"fileUrl": "f"},
+        # No papers and no counters yet
+        "courses/C3": {"course_name": "Chemistry"},
+    }
+
+COUNTED = {
+    "courses/C1": {"mid_sem_papers": 2, "end_sem_papers": 1, "quiz_papers": 0, "total_papers": 3},
+    "courses/C2": {"mid_sem_papers": 1, "end_sem_papers": 1, "quiz_papers": 1, "total_papers": 3},
+    "courses/C3": {"mid_sem_papers": 0, "end_sem_papers": 0, "quiz_papers": 0, "total_papers": 0},
+}
+
+def stored_counters(db):
+    return {
+        path: {field: data.get(field) for field in course_counts.COUNTER_FIELDS}
+        for path, data in db.docs.items() if path.count("/") == 1
+    }
+
+class CountPapersTest(unittest.TestCase):
+    def test_placeholder_is_not_counted(self):
+        db = FakeFirestore(sample_docs())
+        course = db.document("courses/C1")
+        self.assertEqual(course_counts.count_papers(course.collection("mid-semester")), 2)
+        self.assertEqual(course_counts.count_papers(course.collection("quizzes")), 0)
+
+    def test_course_totals(self):
+        db = FakeFirestore(sample_docs())
+        self.assertEqual(course_counts.count_course_papers(db.document("courses/C1")), COUNTED["courses/C1"])
+        self.assertEqual(db.document_reads, 0)
+
+class CountCoursesTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.checkpoint_file = os.path.join(directory.name, "checkpoint.json")
+        patcher = mock.patch.object(script16, "CHECKPOINT_FILE", self.checkpoint_file)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_quietly(self, function, *args, **kwargs):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return function(*args, **kwargs)
+
+    def test_partial_failure_skips_the_course(self):
+        db = FakeFirestore(sample_docs())
+
+        def count_papers(sub_collection_ref):
+            if sub_collection_ref.path == "courses/C2/quizzes":
+                raise RuntimeError("quota exceeded")
+            return course_counts.count_papers(sub_collection_ref)
+
+        courses = list(db.collection("courses").stream())
+        with mock.patch.object(script16, "count_papers", count_papers):
+            with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+                updates, failed = self.run_quietly(script16.count_courses, executor, courses)
+
+        self.assertEqual(failed, {"C2"})
+        self.assertEqual(
+            {course.reference.path: update_data for course, update_data in updates},
+            {path: COUNTED[path] for path in ("courses/C1", "courses/C3")}
+        )
+
+    def test_failed_page_keeps_its_counters_and_checkpoint(self):
+        db = FakeFirestore(sample_docs())
+
+        def count_papers(sub_collection_ref):
+            if sub_collection_ref.path == "courses/C2/quizzes":
+                raise RuntimeError("quota exceeded")
+            return course_counts.count_papers(sub_collection_ref)
+
+        with mock.patch.object(script16, "count_papers", count_papers):
+            self.run_quietly(script16.update_course_totals, db)
+
+        self.assertEqual(stored_counters(db)["courses/C2"]["total_papers"], 7)
+        self.assertEqual(stored_counters(db)["courses/C1"], COUNTED["courses/C1"])
+        self.assertFalse(os.path.exists(self.checkpoint_file))
+
+    def test_update_course_totals_writes_only_changes(self):
+        db = FakeFirestore(sample_docs())
+        self.run_quietly(script16.update_course_totals, db)
+        self.assertEqual(stored_counters(db), COUNTED)
+
+        db.writes.clear()
+        self.run_quietly(script16.update_course_totals, db)
+        self.assertEqual(db.writes, [])
+
+    def test_resume_skips_committed_courses(self):
+        db = FakeFirestore(sample_docs())
+        with open(self.checkpoint_file, "w", encoding="utf-8") as f:
+            json.dump({"last_id": "C1", "order_value": None, "processed": 1}, f)
+
+        self.run_quietly(script16.update_course_totals, db)
+
+        counters = stored_counters(db)
+        self.assertEqual(counters["courses/C1"]["total_papers"], 0)
+        self.assertEqual(counters["courses/C2"], COUNTED["courses/C2"])
+        self.assertEqual(counters["courses/C3"], COUNTED["courses/C3"])
+        self.assertFalse(os.path.exists(self.checkpoint_file))
+
+class CheckpointedQueryTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.checkpoint_file = os.path.join(directory.name, "checkpoint.json")
+        self.db = FakeFirestore({f"courses/C{i}": {"n": i} for i in range(1, 6)})
+
+    def test_resumes_after_last_commit(self):
+        courses = CheckpointedQuery(self.db.collection("courses"), self.checkpoint_file, page_size=2)
+        first_page = next(courses.pages())
+        courses.commit(first_page[-1], count=len(first_page))
+
+        resumed = CheckpointedQuery(self.db.collection("courses"), self.checkpoint_file, page_size=2)
+        self.assertTrue(resumed.resumed)
+        self.assertEqual((resumed.last_id, resumed.processed), ("C2", 2))
+        self.assertEqual([[course.id for course in page] for page in resumed.pages()], [["C3", "C4"], ["C5"]])
+
+        resumed.finish()
+        self.assertFalse(os.path.exists(self.checkpoint_file))
+        self.assertFalse(CheckpointedQuery(self.db.collection("courses"), self.checkpoint_file).resumed)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import script14
+
+URL = "https://example.com/paper.png"
+
+class HashCacheTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = script14.HashCache(os.path.join(directory.name, "hash_cache.db"))
+        self.addCleanup(self.cache.close)
+
+    def test_fresh_cache_is_truthy(self):
+        self.assertEqual(len(self.cache), 0)
+        self.assertTrue(self.cache)
+
+    def test_fresh_cache_gets_written(self):
+        download = ("abc123", "image/png", None, None, '"etag-1"', "Mon, 01 Jan 2024 00:00:00 GMT")
+        with mock.patch.object(script14, "download_and_hash", return_value=download) as downloaded:
+            result = script14.process_file(
+                URL, "C1", "exams", "P1", {}, script14.DedupIndex(), self.cache
+            )
+        downloaded.assert_called_once_with(URL)
+        self.assertEqual(result["fileHash"], "abc123")
+        self.assertEqual(len(self.cache), 1)
+        self.assertEqual(self.cache.get(URL), ("abc123", None, '"etag-1"', "Mon, 01 Jan 2024 00:00:00 GMT"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import contextlib
+import io
+import unittest
+
+import lecturer_ratings
+from tests.fake_firestore import FakeFirestore
+
+def sample_docs():
+    return {
+        # Stored values already correct
+        "lecturers/L1": {"name": "Ada", "rating": 4.5, "totalRatings": 2},
+        "lecturers/L1/reviews/r1": {"rating": 4},
+        "lecturers/L1/reviews/r2": {"rating": 5},
+        "lecturers/L1/reviews/r3": {"comment": "no rating"},
+        "lecturers/L1/reviews/r4": {"rating": None},
+        # Stale values
+        "lecturers/L2": {"name": "Brian", "rating": 1, "totalRatings": 1},
+        "lecturers/L2/reviews/r1": {"rating": 2},
+        "lecturers/L2/reviews/r2": {"rating": 3},
+        "lecturers/L2/reviews/r3": {"rating": 3},
+        # Never rated
+        "lecturers/L3": {"name": "Chen"},
+        # Correctly stored as unrated
+        "lecturers/L4": {"name": "Dana", "rating": 0, "totalRatings": 0},
+        # Same-named collection outside lecturers, not a lecturer review
+        "courses/C1/reviews/r1": {"rating": 1},
+    }
+
+def run_quietly(engine, db):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return engine(db)
+
+def stored_ratings(db):
+    return {
+        path: {field: data.get(field) for field in lecturer_ratings.RATING_FIELDS}
+        for path, data in db.docs.items() if path.count("/") == 1 and path.startswith("lecturers/")
+    }
+
+EXPECTED = {
+    "lecturers/L1": {"rating": 4.5, "totalRatings": 2},
+    "lecturers/L2": {"rating": 2.67, "totalRatings": 3},
+    "lecturers/L3": {"rating": 0, "totalRatings": 0},
+    "lecturers/L4": {"rating": 0, "totalRatings": 0},
+}
+
+class LecturerRatingsTest(unittest.TestCase):
+    def test_aggregation_engine_rates_every_lecturer(self):
+        db = FakeFirestore(sample_docs())
+        failed = run_quietly(lecturer_ratings.update_ratings, db)
+        self.assertEqual(failed, [])
+        self.assertEqual(stored_ratings(db), EXPECTED)
+
+    def test_engines_agree(self):
+        aggregated = FakeFirestore(sample_docs())
+        scanned = FakeFirestore(sample_docs())
+        run_quietly(lecturer_ratings.update_ratings, aggregated)
+        run_quietly(lecturer_ratings.update_ratings_from_scan, scanned)
+        self.assertEqual(stored_ratings(aggregated), stored_ratings(scanned))
+
+    def test_only_changed_lecturers_are_written(self):
+        for engine in (lecturer_ratings.update_ratings, lecturer_ratings.update_ratings_from_scan):
+            with self.subTest(engine=engine.__name__):
+                db = FakeFirestore(sample_docs())
+                run_quietly(engine, db)
+                self.assertEqual(sorted(path for _, path, _ in db.writes), ["lecturers/L2", "lecturers/L3"])
+
+                db.writes.clear()
+                run_quietly(engine, db)
+                self.assertEqual(db.writes, [])
+
+    def test_aggregation_reads_no_reviews(self):
+        db = FakeFirestore(sample_docs())
+        run_quietly(lecturer_ratings.update_ratings, db)
+        lecturers = len(EXPECTED)
+        self.assertEqual(db.aggregation_requests, lecturers)
+        self.assertEqual(db.document_reads, lecturers)
+
+if __name__ == "__main__":
+    unittest.main()
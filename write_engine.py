@@ -0,0 +1,116 @@
+import threading
+
+from google.cloud.firestore_v1.bulk_writer import BulkWriterOptions
+
+# ---- CONFIGURATION ---- #
+# 500/50/5 ramp-up: start at 500 writes/s and let the budget grow by 50% every
+# 5 minutes, up to MAX_OPS_PER_SECOND, instead of sleeping a guessed time per batch
+INITIAL_OPS_PER_SECOND = 500
+MAX_OPS_PER_SECOND = 10000
+MAX_ATTEMPTS = 10  # Attempts per write before it is reported as failed
+
+# gRPC status codes worth retrying: contention, throttling and transient outages.
+# Anything else (NOT_FOUND, INVALID_ARGUMENT, ...) fails the same way on every attempt.
+RETRYABLE_CODES = {
+    4: "DEADLINE_EXCEEDED",
+    8: "RESOURCE_EXHAUSTED",
+    10: "ABORTED",
+    13: "INTERNAL",
+    14: "UNAVAILABLE"
+}
+
+# Codes after which the write is known not to have been applied. DEADLINE_EXCEEDED,
+# INTERNAL and UNAVAILABLE leave that unknown, so non-idempotent writes (Increment,
+# ArrayUnion of repeats, ...) retry only on these to avoid applying twice
+SAFE_RETRY_CODES = {
+    8: "RESOURCE_EXHAUSTED",
+    10: "ABORTED"
+}
+
+def describe_failure(failure):
+    return f"{failure.operation.reference.path}: {failure.message} (code {failure.code}, {failure.attempts} attempts)"
+
+class BulkWriteError(Exception):
+    """Raised when writes failed permanently; failures holds the BulkWriteFailure objects"""
+    def __init__(self, failures):
+        self.failures = failures
+        super().__init__(f"{len(failures)} write(s) failed, first: {describe_failure(failures[0])}")
+
+class WriteEngine:
+    """
+    Shared write path for every script, on top of Firestore's BulkWriter.
+    Writes are grouped into batches that are sent in parallel under the 500/50/5
+    rate limiter, and retried with backoff on contention or RESOURCE_EXHAUSTED.
+    Unlike a WriteBatch, writes are not atomic with each other; use a batch or a
+    transaction where several writes must land together.
+
+        with WriteEngine(db) as engine:
+            engine.update(doc_ref, {"field": value})
+            failures = engine.flush()   # optional: wait for everything queued so far
+
+    Pass retry_codes=SAFE_RETRY_CODES when the writes are not idempotent.
+    """
+    def __init__(self, db, initial_ops_per_second=INITIAL_OPS_PER_SECOND,
+                 max_ops_per_second=MAX_OPS_PER_SECOND, max_attempts=MAX_ATTEMPTS,
+                 retry_codes=RETRYABLE_CODES):
+        self.max_attempts = max_attempts
+        self.retry_codes = retry_codes
+        self.lock = threading.Lock()
+        self.written = 0
+        self.failed = 0
+        self.failures = []  # Failures since the last flush
+        self.writer = db.bulk_writer(options=BulkWriterOptions(
+            initial_ops_per_second=initial_ops_per_second,
+            max_ops_per_second=max_ops_per_second
+        ))
+        # Callbacks run on the BulkWriter's sender threads
+        self.writer.on_write_result(self._on_success)
+        self.writer.on_write_error(self._on_error)
+
+    def _on_success(self, reference, result, bulk_writer):
+        with self.lock:
+            self.written += 1
+
+    def _on_error(self, failure, bulk_writer):
+        """Returns True to retry the write"""
+        if failure.code in self.retry_codes and failure.attempts < self.max_attempts:
+            return True
+        with self.lock:
+            self.failed += 1
+            self.failures.append(failure)
+        return False
+
+    def create(self, doc_ref, data):
+        self.writer.create(doc_ref, data)
+
+    def set(self, doc_ref, data, merge=False):
+        self.writer.set(doc_ref, data, merge=merge)
+
+    def update(self, doc_ref, data):
+        self.writer.update(doc_ref, data)
+
+    def delete(self, doc_ref):
+        self.writer.delete(doc_ref)
+
+    def _take_failures(self):
+        with self.lock:
+            failures, self.failures = self.failures, []
+        return failures
+
+    def flush(self):
+        """Block until every queued write has succeeded or failed; returns the new failures"""
+        self.writer.flush()
+        return self._take_failures()
+
+    def close(self):
+        """Flush, then reject further writes; returns the failures not yet collected"""
+        self.writer.close()
+        return self._take_failures()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        failures = self.close()
+        if failures and exc_type is None:
+            raise BulkWriteError(failures)